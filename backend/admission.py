@@ -0,0 +1,179 @@
+"""
+Short-lived cache for websocket admission lookups.
+
+A reconnect storm would otherwise decode the same tokens and run the same
+user and room queries thousands of times. This keeps decoded token claims,
+the user's ``(user_id, username, favorite_team)`` for ``ADMISSION_CACHE_TTL``
+seconds, and the fan room / live game catalogs for ``ADMISSION_CATALOG_TTL``
+seconds. Profile updates and account deletion invalidate the user on every
+worker via the backplane.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from fastapi import HTTPException, status
+from jose import jwt
+from sqlalchemy.orm import Session
+
+from auth import get_user_by_username, verify_token
+from backplane import backplane
+from config import settings
+from models import FanRoom, LiveGame
+
+BACKPLANE_CHANNEL = "admission"
+
+
+class Identity(NamedTuple):
+    user_id: bytes
+    username: str
+    favorite_team: Optional[str]
+
+
+class FanRoomInfo(NamedTuple):
+    id: int
+    team_name: str
+
+
+class LiveGameInfo(NamedTuple):
+    id: int
+    home_team: str
+    away_team: str
+    match_date: Optional[datetime]
+    closed_at: Optional[datetime] = None
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+
+class AdmissionCache:
+    """Cached token, user and room lookups for websocket connects."""
+
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None) -> None:
+        ttl = ttl if ttl is not None else settings.ADMISSION_CACHE_TTL
+        max_size = max_size or settings.ADMISSION_CACHE_SIZE
+        self.tokens = TTLCache(ttl, max_size)
+        self.identities = TTLCache(ttl, max_size)
+        self.fan_rooms = TTLCache(settings.ADMISSION_CATALOG_TTL, 1024)
+        self.live_games = TTLCache(settings.ADMISSION_CATALOG_TTL, 1024)
+        self._fan_catalog_loaded_at = float("-inf")
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+        backplane.subscribe(BACKPLANE_CHANNEL, self._on_backplane_message)
+
+    def username_for_token(self, token: str) -> Optional[str]:
+        """Return the token's subject, or None if the token is invalid or expired."""
+        cached = self.tokens.get(token)
+        if cached is not None:
+            username, expires_at = cached
+            if expires_at > time.time():
+                self.counters["hits"] += 1
+                return username
+            self.tokens.pop(token)
+
+        self.counters["misses"] += 1
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+        try:
+            token_data = verify_token(token, credentials_exception)
+        except HTTPException:
+            return None
+
+        expires_at = float(jwt.get_unverified_claims(token).get("exp", 0))
+        ttl = min(self.tokens.ttl, max(0.0, expires_at - time.time()))
+        self.tokens.set(token, (token_data.username, expires_at), ttl)
+        return token_data.username
+
+    def identity_for(self, db: Session, username: str) -> Optional[Identity]:
+        identity = self.identities.get(username)
+        if identity is not None:
+            self.counters["hits"] += 1
+            return identity
+
+        self.counters["misses"] += 1
+        user = get_user_by_username(db, username)
+        if user is None:
+            return None
+        identity = Identity(user.user_id, user.username, user.favorite_team)
+        self.identities.set(username, identity)
+        return identity
+
+    def fan_room(self, db: Session, room_id: int) -> Optional[FanRoomInfo]:
+        room = self.fan_rooms.get(room_id)
+        if room is not None:
+            self.counters["hits"] += 1
+            return room
+        if time.monotonic() - self._fan_catalog_loaded_at < self.fan_rooms.ttl:
+            # The catalog is fresh, so the room simply doesn't exist.
+            self.counters["hits"] += 1
+            return None
+
+        # The catalog is tiny and static; reload all of it on a miss.
+        self.counters["misses"] += 1
+        for row in db.query(FanRoom.id, FanRoom.team_name).all():
+            self.fan_rooms.set(row.id, FanRoomInfo(row.id, row.team_name))
+        self._fan_catalog_loaded_at = time.monotonic()
+        return self.fan_rooms.get(room_id)
+
+    def live_game(self, db: Session, game_id: int) -> Optional[LiveGameInfo]:
+        game = self.live_games.get(game_id)
+        if game is not None:
+            self.counters["hits"] += 1
+            return game
+
+        self.counters["misses"] += 1
+        row = (
+            db.query(LiveGame.id, LiveGame.home_team, LiveGame.away_team, LiveGame.match_date, LiveGame.closed_at)
+            .filter(LiveGame.id == game_id)
+            .first()
+        )
+        if row is None:
+            return None
+        game = LiveGameInfo(*row)
+        self.live_games.set(game_id, game)
+        return game
+
+    async def invalidate_user(self, *usernames: Optional[str]) -> None:
+        """Forget cached identities for these usernames on every worker."""
+        for username in {name for name in usernames if name}:
+            await backplane.publish(BACKPLANE_CHANNEL, {"kind": "invalidate_user", "username": username})
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "cached_tokens": len(self.tokens.entries), "cached_users": len(self.identities.entries)}
+
+    def _on_backplane_message(self, message: Dict[str, Any]) -> None:
+        if message.get("kind") == "invalidate_user":
+            self.identities.pop(message["username"])
+            self.counters["invalidations"] += 1
+
+
+admission_cache = AdmissionCache()
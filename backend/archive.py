@@ -0,0 +1,147 @@
+"""
+Cold storage for old chat history.
+
+Fan room days older than ``ARCHIVE_FAN_ROOM_RETENTION_DAYS`` and live games
+closed more than ``ARCHIVE_LIVE_GAME_RETENTION_DAYS`` ago are moved out of
+the message tables into gzip-compressed JSONL files, one per room day or
+game, under ``ARCHIVE_DIR``:
+
+    fanrooms/<room_id>/<YYYY-MM-DD>.jsonl.gz
+    livegames/<game_id>.jsonl.gz
+
+Each line is one message shaped like the history endpoints' response, in
+the order those endpoints sort by, so the endpoints can read archived days
+straight back. The file is written before the rows are deleted. Archiving
+the same day twice merges by message ID, so the job can be re-run safely.
+"""
+
+import asyncio
+import fcntl
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from broadcast import encode_frame
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Archived lists kept decompressed for repeat reads.
+READ_CACHE_SIZE = 16
+
+ArchiveTask = Callable[[Session, datetime], int]
+
+
+class ChatArchive:
+    """Reads and writes per-day and per-game archive files."""
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = root or settings.ARCHIVE_DIR
+        self._cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fan_room_day_path(self, room_id: int, day: date) -> str:
+        return os.path.join(self.root, "fanrooms", str(room_id), f"{day.isoformat()}.jsonl.gz")
+
+    def live_game_path(self, game_id: int) -> str:
+        return os.path.join(self.root, "livegames", f"{game_id}.jsonl.gz")
+
+    def fan_room_day(self, room_id: int, day: date) -> Optional[List[Dict[str, Any]]]:
+        """The archived messages for a room day, or None if it isn't archived."""
+        return self.read(self.fan_room_day_path(room_id, day))
+
+    def live_game(self, game_id: int) -> Optional[List[Dict[str, Any]]]:
+        return self.read(self.live_game_path(game_id))
+
+    def read(self, path: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+                return cached
+        if not os.path.exists(path):
+            return None
+
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            messages = [json.loads(line) for line in archive]
+
+        with self._lock:
+            self._cache[path] = messages
+            while len(self._cache) > READ_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return messages
+
+    def write(self, path: str, messages: List[Dict[str, Any]], sort_key: Callable[[dict], Any]) -> int:
+        """Write (or merge into) an archive file atomically. Returns the message count."""
+        existing = self.read(path) or []
+        merged = {message["message_id"]: message for message in existing}
+        merged.update((message["message_id"], message) for message in messages)
+        ordered = sorted(merged.values(), key=sort_key)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+            for message in ordered:
+                archive.write(encode_frame(message) + "\n")
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._cache.pop(path, None)
+        return len(ordered)
+
+
+class ArchiveJob:
+    """
+    Runs the archive tasks in a worker thread every ``ARCHIVE_INTERVAL_HOURS``.
+    A lock file in the archive directory keeps workers from running at once.
+    """
+
+    def __init__(self, tasks: List[ArchiveTask], session_factory=SessionLocal) -> None:
+        self.tasks = tasks
+        self.session_factory = session_factory
+        self.interval = settings.ARCHIVE_INTERVAL_HOURS * 3600
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        os.makedirs(chat_archive.root, exist_ok=True)
+        with open(os.path.join(chat_archive.root, ".lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another worker is already archiving.
+                return 0
+            archived = 0
+            for task in self.tasks:
+                with self.session_factory() as db:
+                    archived += task(db, now)
+            return archived
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                archived = await asyncio.to_thread(self.run_once)
+                if archived:
+                    logger.info("Archived %s chat messages to %s", archived, chat_archive.root)
+            except Exception:
+                logger.exception("Chat archive run failed")
+            await asyncio.sleep(self.interval)
+
+
+chat_archive = ChatArchive()
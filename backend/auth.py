@@ -16,6 +16,9 @@ pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# Usernames kept for system accounts (FootyBot posts in fan rooms as "FootyBot").
+RESERVED_USERNAMES = frozenset({"footybot"})
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return pwd_context.verify(plain_password, hashed_password)
@@ -52,6 +55,10 @@ def get_user_by_username(db: Session, username: str):
     """Get user by username."""
     return db.query(User).filter(User.username == username).first()
 
+def is_reserved_username(username: str) -> bool:
+    """Whether a username belongs to a system account and can't be taken."""
+    return username.strip().lower() in RESERVED_USERNAMES
+
 def get_user_by_email(db: Session, email: str):
     """Get user by email."""
     return db.query(User).filter(User.email == email).first()
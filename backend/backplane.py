@@ -0,0 +1,381 @@
+"""
+Pub/sub backplane that lets fan rooms and live games span several workers.
+
+Connection managers publish chat, bot and presence messages to a channel
+instead of writing straight to their local sockets. Every worker subscribed to
+the channel (including the publisher) receives the message and fans it out to
+the sockets it owns.
+
+Two implementations are provided:
+- ``InProcessBackplane``: single worker, delivers locally only (the default).
+- ``UnixSocketBackplane``: workers on one host talk through a small broker
+  listening on a Unix socket. The first worker to grab the lock file hosts the
+  broker; it can also be run standalone with ``python -m backplane``.
+
+Select one with ``BACKPLANE_URL`` (``memory://`` or ``unix:///path/to.sock``).
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Set
+
+from broadcast import encode_frame
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[Dict[str, Any]], None]
+CountsProvider = Callable[[], Dict[int, int]]
+
+DEFAULT_SOCKET_PATH = "/tmp/footysocial-backplane.sock"
+
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+# Broker clients whose unsent backlog grows past this are cut off.
+BROKER_CLIENT_BUFFER_LIMIT = 4 * 1024 * 1024
+
+
+class PresenceTable:
+    """Connection counts reported by the other workers, per room."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        # room_id -> worker_id -> count
+        self.counts: Dict[int, Dict[str, int]] = defaultdict(dict)
+        self.last_seen: Dict[str, float] = {}
+
+    def update(self, worker_id: str, room_id: int, count: int) -> None:
+        self.last_seen[worker_id] = time.monotonic()
+        if count:
+            self.counts[room_id][worker_id] = count
+        else:
+            self._discard(room_id, worker_id)
+
+    def replace(self, worker_id: str, counts: Dict[int, int]) -> None:
+        """Replace everything known about a worker with a fresh snapshot."""
+        self.forget(worker_id)
+        self.last_seen[worker_id] = time.monotonic()
+        for room_id, count in counts.items():
+            if count:
+                self.counts[int(room_id)][worker_id] = count
+
+    def forget(self, worker_id: str) -> None:
+        self.last_seen.pop(worker_id, None)
+        for room_id in list(self.counts):
+            self._discard(room_id, worker_id)
+
+    def total(self, room_id: int) -> int:
+        self.expire()
+        return sum(self.counts.get(room_id, {}).values())
+
+    def rooms(self) -> Set[int]:
+        self.expire()
+        return set(self.counts)
+
+    def expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        for worker_id, seen in list(self.last_seen.items()):
+            if seen < cutoff:
+                logger.info("Expiring presence from silent worker %s", worker_id)
+                self.forget(worker_id)
+
+    def _discard(self, room_id: int, worker_id: str) -> None:
+        room_counts = self.counts.get(room_id)
+        if room_counts is None:
+            return
+        room_counts.pop(worker_id, None)
+        if not room_counts:
+            self.counts.pop(room_id, None)
+
+
+class Backplane:
+    """Base class: local delivery plus a hook for forwarding to other workers."""
+
+    def __init__(self) -> None:
+        self.worker_id = uuid.uuid4().hex
+        self.handlers: Dict[str, MessageHandler] = {}
+        self.counts_providers: Dict[str, CountsProvider] = {}
+        self.presence: Dict[str, PresenceTable] = defaultdict(
+            lambda: PresenceTable(settings.BACKPLANE_PRESENCE_INTERVAL * 3)
+        )
+
+    def subscribe(self, channel: str, handler: MessageHandler, counts_provider: Optional[CountsProvider] = None) -> None:
+        """Register the handler for a channel and, optionally, its local presence counts."""
+        self.handlers[channel] = handler
+        if counts_provider is not None:
+            self.counts_providers[channel] = counts_provider
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        """Deliver a message to this worker's subscriber and to every other worker."""
+        message = {**message, "channel": channel, "origin": self.worker_id}
+        self._dispatch(message)
+        await self._forward(message)
+
+    def remote_count(self, channel: str, room_id: int) -> int:
+        return self.presence[channel].total(room_id)
+
+    def remote_rooms(self, channel: str) -> Set[int]:
+        return self.presence[channel].rooms()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def _forward(self, message: Dict[str, Any]) -> None:
+        pass
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        channel = message.get("channel")
+        origin = message.get("origin")
+
+        if origin != self.worker_id:
+            # Keep the cross-worker presence view current before handlers read it.
+            kind = message.get("kind")
+            table = self.presence[channel]
+            if kind == "presence":
+                table.update(origin, int(message["room_id"]), int(message["count"]))
+            elif kind == "presence_snapshot":
+                table.replace(origin, message.get("counts", {}))
+                return
+            elif kind == "worker_exit":
+                table.forget(origin)
+                return
+
+        handler = self.handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Backplane handler for %s failed", channel)
+
+
+class InProcessBackplane(Backplane):
+    """Single-process backplane: every message is delivered locally."""
+
+
+class UnixSocketBroker:
+    """Relays newline-delimited messages between every connected worker."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.clients: Set[asyncio.StreamWriter] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(
+            self._handle_client, path=self.path, limit=MAX_MESSAGE_BYTES
+        )
+        logger.info("Backplane broker listening on %s", self.path)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for client in list(self.clients):
+            client.close()
+        self.clients.clear()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    logger.warning("Backplane broker discarding an oversized message")
+                    continue
+                if not line:
+                    break
+                for client in list(self.clients):
+                    if client is writer:
+                        continue
+                    if client.transport.get_write_buffer_size() > BROKER_CLIENT_BUFFER_LIMIT:
+                        logger.warning("Backplane broker dropping a worker that stopped reading")
+                        self.clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+
+class UnixSocketBackplane(Backplane):
+    """Backplane for several workers on one host, via a Unix-socket broker."""
+
+    def __init__(self, path: str, host_broker: bool = True) -> None:
+        super().__init__()
+        self.path = path
+        self.host_broker = host_broker
+        self.broker: Optional[UnixSocketBroker] = None
+        self._lock_file = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def start(self) -> None:
+        reader = await self._connect()
+        await self._publish_snapshots()
+        self._spawn(self._read_loop(reader))
+        self._spawn(self._presence_loop())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for channel in self.counts_providers:
+            await self._forward({"kind": "worker_exit", "channel": channel, "origin": self.worker_id})
+        for task in list(self._tasks):
+            task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        if self.broker is not None:
+            await self.broker.stop()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    async def _forward(self, message: Dict[str, Any]) -> None:
+        if self._writer is None:
+            logger.debug("Backplane disconnected; message not forwarded")
+            return
+        try:
+            self._writer.write(encode_frame(message).encode("utf-8") + b"\n")
+            await self._writer.drain()
+        except ConnectionError:
+            self._writer = None
+
+    async def _connect(self) -> asyncio.StreamReader:
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_BYTES)
+                self._writer = writer
+                return reader
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.host_broker and self._try_become_broker():
+                    self.broker = UnixSocketBroker(self.path)
+                    await self.broker.start()
+                    continue
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def _try_become_broker(self) -> bool:
+        if self.broker is not None:
+            return False
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held for the life of the process so only one worker hosts the broker.
+        self._lock_file = lock_file
+        return True
+
+    async def _read_loop(self, reader: Optional[asyncio.StreamReader]) -> None:
+        while not self._stopping:
+            try:
+                if reader is None:
+                    reader = await self._connect()
+                    await self._publish_snapshots()
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                # Longer than MAX_MESSAGE_BYTES; readline has already dropped it.
+                logger.warning("Discarding oversized backplane message")
+                continue
+            except (OSError, asyncio.IncompleteReadError) as exc:
+                logger.warning("Backplane connection failed (%r); reconnecting", exc)
+                line = None
+            if not line:
+                if line is not None:
+                    logger.warning("Backplane connection lost; reconnecting")
+                self._drop_connection()
+                reader = None
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning("Discarding malformed backplane message")
+                continue
+            try:
+                self._dispatch(message)
+            except Exception:
+                logger.exception("Discarding backplane message its handler failed on")
+
+    def _drop_connection(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        origin = message.get("origin")
+        if (
+            message.get("kind") == "presence_snapshot"
+            and origin != self.worker_id
+            and origin not in self.presence[message.get("channel")].last_seen
+        ):
+            # Introduce ourselves to a newly started worker rather than making
+            # it wait a full refresh interval for our counts.
+            self._spawn(self._publish_snapshots())
+        super()._dispatch(message)
+
+    async def _presence_loop(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(settings.BACKPLANE_PRESENCE_INTERVAL)
+            await self._publish_snapshots()
+
+    async def _publish_snapshots(self) -> None:
+        for channel, provider in self.counts_providers.items():
+            await self._forward(
+                {
+                    "kind": "presence_snapshot",
+                    "channel": channel,
+                    "origin": self.worker_id,
+                    "counts": {str(room_id): count for room_id, count in provider().items()},
+                }
+            )
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def create_backplane(url: Optional[str] = None) -> Backplane:
+    """Build the backplane named by ``url`` (defaults to ``BACKPLANE_URL``)."""
+    url = url or settings.BACKPLANE_URL
+    if url.startswith("unix://"):
+        return UnixSocketBackplane(url[len("unix://"):])
+    if url.startswith("memory://"):
+        return InProcessBackplane()
+    raise ValueError(f"Unsupported backplane URL: {url}")
+
+
+backplane = create_backplane()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the FootySocial backplane broker.")
+    default_socket = settings.BACKPLANE_URL[len("unix://"):] if settings.BACKPLANE_URL.startswith("unix://") else DEFAULT_SOCKET_PATH
+    parser.add_argument("--socket", default=default_socket)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(UnixSocketBroker(args.socket).serve_forever())
@@ -0,0 +1,80 @@
+"""
+Microbenchmark: JSON encoding cost per broadcast chat message.
+
+Compares the old path (``send_json`` re-encoding the payload for every
+recipient) with the serialise-once path used by ``BroadcastEngine``, for the
+stdlib encoder and orjson when it is installed.
+
+Run from the backend directory:
+    python -m benchmarks.bench_broadcast_encoding
+"""
+
+import json
+import sys
+import time
+from datetime import datetime
+
+from broadcast import encode_frame, orjson
+
+ROOM_SIZES = [10, 100, 1_000, 10_000]
+MESSAGES = 50
+
+
+def sample_payload() -> dict:
+    now = datetime.utcnow()
+    return {
+        "type": "chat_message",
+        "message_id": 123456,
+        "room_id": 7,
+        "user_id": "5f0c6a2e-8b9d-4f3e-9a1b-2c3d4e5f6a7b",
+        "username": "gooner_1886",
+        "content": "What a strike! That's going straight into the top corner 🔥⚽",
+        "created_at": now.isoformat(),
+        "chat_date": now.date().isoformat(),
+    }
+
+
+def stdlib_encode(payload: dict) -> str:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def per_recipient(encoder, payload: dict, room_size: int) -> None:
+    # What send_json did: one encode per socket.
+    for _ in range(room_size):
+        encoder(payload)
+
+
+def serialise_once(encoder, payload: dict, room_size: int) -> None:
+    frame = encoder(payload)
+    # Every recipient receives the same buffer; only the reference is copied.
+    shared = [frame] * room_size
+    del shared
+
+
+def measure(strategy, encoder, room_size: int) -> float:
+    payload = sample_payload()
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        strategy(encoder, payload, room_size)
+    return (time.perf_counter() - start) / MESSAGES * 1_000_000
+
+
+def main() -> None:
+    encoders = [("stdlib", stdlib_encode)]
+    if orjson is not None:
+        encoders.append(("orjson", encode_frame))
+    else:
+        print("orjson not installed; only the stdlib encoder is measured.", file=sys.stderr)
+
+    header = f"{'room size':>10} {'encoder':>8} {'per-recipient us/msg':>22} {'serialise-once us/msg':>23} {'speedup':>9}"
+    print(header)
+    print("-" * len(header))
+    for room_size in ROOM_SIZES:
+        for name, encoder in encoders:
+            old = measure(per_recipient, encoder, room_size)
+            new = measure(serialise_once, encoder, room_size)
+            print(f"{room_size:>10} {name:>8} {old:>22.1f} {new:>23.1f} {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: memory held per websocket connection for the user's session record.
+
+Seeds 10k users in a throwaway SQLite database and admits each one the way
+the websocket handlers do, keeping what a connection holds on to:
+- orm + session: the ``User`` instance plus the open ``Session`` it was
+  loaded with, which the handlers used to keep for the socket's lifetime
+- orm detached: the same instances after their sessions are closed
+- identity: the ``Identity`` record the managers keep now
+- slots class: a three-attribute ``__slots__`` class, for comparison
+
+Only Python allocations are traced (tracemalloc), so SQLite's own buffers
+aren't counted. Every session shares one connection here; in production each
+held session also kept a pooled connection checked out until its first
+commit.
+
+Run from the backend directory:
+    python -m benchmarks.bench_connection_memory
+"""
+
+import gc
+import os
+import tempfile
+import tracemalloc
+import uuid
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from admission import Identity
+from auth import get_user_by_username
+from models import Base, User
+
+CONNECTIONS = 10_000
+
+
+class SlotsIdentity:
+    __slots__ = ("user_id", "username", "favorite_team")
+
+    def __init__(self, user_id: bytes, username: str, favorite_team: Optional[str]) -> None:
+        self.user_id = user_id
+        self.username = username
+        self.favorite_team = favorite_team
+
+
+def seed(session_factory) -> List[str]:
+    usernames = [f"fan_{index}" for index in range(CONNECTIONS)]
+    with session_factory() as db:
+        db.add_all(
+            User(
+                user_id=uuid.uuid4().bytes,
+                first_name="Bench",
+                last_name=str(index),
+                username=username,
+                email=f"{username}@example.com",
+                password_hash="x",
+                favorite_team="Arsenal",
+            )
+            for index, username in enumerate(usernames)
+        )
+        db.commit()
+    return usernames
+
+
+def orm_with_session(session_factory, usernames: List[str]) -> list:
+    held = []
+    for username in usernames:
+        db = session_factory()
+        held.append((db, get_user_by_username(db, username)))
+    return held
+
+
+def orm_detached(session_factory, usernames: List[str]) -> list:
+    held = []
+    for username in usernames:
+        with session_factory() as db:
+            held.append(get_user_by_username(db, username))
+    return held
+
+
+def records(record_type: Callable) -> Callable:
+    def admit(session_factory, usernames: List[str]) -> list:
+        held = []
+        for username in usernames:
+            with session_factory() as db:
+                user = get_user_by_username(db, username)
+                held.append(record_type(user.user_id, user.username, user.favorite_team))
+        return held
+
+    return admit
+
+
+def measure(session_factory, usernames: List[str], admit: Callable) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = admit(session_factory, usernames)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return retained
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        usernames = seed(session_factory)
+
+        variants = [
+            ("orm + session", orm_with_session),
+            ("orm detached", orm_detached),
+            ("identity", records(Identity)),
+            ("slots class", records(SlotsIdentity)),
+        ]
+        header = f"{'record':>14} {'bytes/conn':>11} {f'MB per {CONNECTIONS // 1000}k':>11}"
+        print(header)
+        print("-" * len(header))
+        for name, admit in variants:
+            retained = measure(session_factory, usernames, admit)
+            print(f"{name:>14} {retained / CONNECTIONS:>11.0f} {retained / 1024 / 1024:>11.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmark: queries per request and latency of the message history endpoints.
+
+Seeds a throwaway SQLite database with 100, 1k and 10k messages for one fan
+room day and one live game, then compares:
+- legacy: full ORM objects, lazy ``message.user`` loads and a Pydantic model
+  per row (how the endpoints used to work)
+- join-fetch: the tuple query the endpoints now use, over the same rows
+- endpoint: the real endpoint functions with their default page
+- catch-up: a live game client that missed the last 20 messages (since_id)
+
+Run from the backend directory:
+    python -m benchmarks.bench_message_history
+"""
+
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from broadcast import encode_frame
+from message_buffer import recent_messages
+from models import Base, FanRoom, FanRoomMessage, LiveGame, LiveGameMessage, User
+from routers.fanrooms import (
+    fan_room_buffer_key,
+    fan_room_history_query,
+    fan_room_rows_to_dicts,
+    get_fan_room_messages,
+)
+from routers.livegame import (
+    get_live_game_messages,
+    live_game_buffer_key,
+    live_game_history_query,
+    live_game_rows_to_dicts,
+)
+from schemas import FanRoomMessageResponse, LiveGameMessageResponse
+from utils import uuid_bytes_to_str
+
+MESSAGE_COUNTS = [100, 1_000, 10_000]
+DISTINCT_USERS = 200
+REPEATS = 5
+
+
+class QueryCounter:
+    def __init__(self, engine) -> None:
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def seed(session_factory, message_count: int):
+    with session_factory() as db:
+        users = [
+            User(
+                user_id=uuid.uuid4().bytes,
+                first_name="Bench",
+                last_name=str(i),
+                username=f"bench_user_{i}",
+                email=f"bench{i}@example.com",
+                password_hash="x",
+            )
+            for i in range(DISTINCT_USERS)
+        ]
+        db.add_all(users)
+        room = FanRoom(team_name="Arsenal")
+        game = LiveGame(home_team="Arsenal", away_team="Chelsea", match_date=datetime.utcnow())
+        db.add_all([room, game])
+        db.commit()
+
+        start = datetime.combine(date.today(), datetime.min.time())
+        fan_rows, game_rows = [], []
+        for i in range(message_count):
+            user_id = users[i % DISTINCT_USERS].user_id
+            created_at = start + timedelta(seconds=i)
+            fan_rows.append(
+                {"room_id": room.id, "user_id": user_id, "content": f"message {i}", "created_at": created_at, "chat_date": start.date()}
+            )
+            game_rows.append({"game_id": game.id, "user_id": user_id, "content": f"message {i}", "created_at": created_at})
+        db.bulk_insert_mappings(FanRoomMessage, fan_rows)
+        db.bulk_insert_mappings(LiveGameMessage, game_rows)
+        db.commit()
+        return room.id, game.id
+
+
+def legacy_fan_room(db, room_id: int) -> bytes:
+    messages = (
+        db.query(FanRoomMessage)
+        .filter(FanRoomMessage.room_id == room_id, FanRoomMessage.chat_date == date.today())
+        .order_by(FanRoomMessage.created_at.asc())
+        .all()
+    )
+    responses = [
+        FanRoomMessageResponse(
+            message_id=message.id,
+            room_id=message.room_id,
+            user_id=uuid_bytes_to_str(message.user_id) or "",
+            username=message.user.username if message.user else "Unknown",
+            content=message.content,
+            created_at=message.created_at,
+            chat_date=message.chat_date,
+        )
+        for message in messages
+    ]
+    return TypeAdapter(List[FanRoomMessageResponse]).dump_json(responses)
+
+
+def join_fetch_fan_room(db, room_id: int) -> str:
+    rows = (
+        fan_room_history_query(db)
+        .filter(FanRoomMessage.room_id == room_id, FanRoomMessage.chat_date == date.today())
+        .order_by(FanRoomMessage.created_at.asc(), FanRoomMessage.id.asc())
+        .all()
+    )
+    return encode_frame(fan_room_rows_to_dicts(room_id, rows))
+
+
+def legacy_live_game(db, game_id: int) -> bytes:
+    messages = db.query(LiveGameMessage).filter(LiveGameMessage.game_id == game_id).all()
+    responses = [
+        LiveGameMessageResponse(
+            message_id=message.id,
+            game_id=message.game_id,
+            user_id=uuid_bytes_to_str(message.user_id) or "",
+            username=message.user.username if message.user else "Unknown",
+            content=message.content,
+            created_at=message.created_at,
+        )
+        for message in messages
+    ]
+    return TypeAdapter(List[LiveGameMessageResponse]).dump_json(responses)
+
+
+def join_fetch_live_game(db, game_id: int) -> str:
+    rows = live_game_history_query(db).filter(LiveGameMessage.game_id == game_id).all()
+    return encode_frame(live_game_rows_to_dicts(game_id, rows))
+
+
+def measure(session_factory, counter: QueryCounter, fn, *args):
+    timings, queries = [], 0
+    for _ in range(REPEATS):
+        # Fresh session per run so the identity map can't hide lazy loads.
+        with session_factory() as db:
+            counter.count = 0
+            start = time.perf_counter()
+            fn(db, *args)
+            timings.append(time.perf_counter() - start)
+            queries = counter.count
+    return queries, statistics.median(timings) * 1000
+
+
+def main() -> None:
+    header = f"{'messages':>9} {'endpoint':>10} {'variant':>12} {'queries':>8} {'median ms':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for message_count in MESSAGE_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(engine)
+            session_factory = sessionmaker(bind=engine)
+            room_id, game_id = seed(session_factory, message_count)
+            counter = QueryCounter(engine)
+            # IDs restart in every throwaway database, so drop buffers from the last one.
+            recent_messages.discard(fan_room_buffer_key(room_id, date.today().isoformat()))
+            recent_messages.discard(live_game_buffer_key(game_id))
+
+            variants = [
+                ("fanroom", "legacy", legacy_fan_room, room_id),
+                ("fanroom", "join-fetch", join_fetch_fan_room, room_id),
+                ("fanroom", "page (100)", lambda db, rid: get_fan_room_messages(room_id=rid, db=db), room_id),
+                ("livegame", "legacy", legacy_live_game, game_id),
+                ("livegame", "join-fetch", join_fetch_live_game, game_id),
+                ("livegame", "page (100)", lambda db, gid: get_live_game_messages(game_id=gid, db=db), game_id),
+                (
+                    "livegame",
+                    "since (20)",
+                    lambda db, gid: get_live_game_messages(game_id=gid, since_id=message_count - 20, db=db),
+                    game_id,
+                ),
+            ]
+            for endpoint, variant, fn, target in variants:
+                queries, median_ms = measure(session_factory, counter, fn, target)
+                print(f"{message_count:>9} {endpoint:>10} {variant:>12} {queries:>8} {median_ms:>10.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
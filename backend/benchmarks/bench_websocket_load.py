@@ -0,0 +1,348 @@
+"""
+Benchmark: websocket load against a real server process.
+
+Starts the app under uvicorn against a throwaway SQLite database, seeds one
+user per client, mints their JWTs with ``create_access_token`` and opens the
+clients across fan rooms and live games. Once everyone is connected, a share
+of the clients send chat at a fixed total rate for the run's duration. Every
+message carries its send time, so each delivery to each room member gives
+one end-to-end latency sample.
+
+Reports connect time (socket open to welcome frame), p50/p95/p99 delivery
+latency, delivery ratio and the server's CPU time as JSON, so runs can be
+diffed across commits. Chat rate limits are lifted on the server so they
+don't cap the offered load, and no message mentions FootyBot.
+
+Run from the backend directory:
+    python -m benchmarks.bench_websocket_load --clients 500 --rate 200 --duration 15
+    python -m benchmarks.bench_websocket_load --output load.json --label my-branch
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from auth import create_access_token
+from models import Base, FanRoom, LiveGame, User
+from routers.fanrooms import FAN_ROOM_TEAM_NAMES
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - falls back to /proc
+    psutil = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous limits so flood control doesn't shape the offered load.
+SERVER_ENV = {
+    "CHAT_USER_RATE": "1000",
+    "CHAT_USER_BURST": "1000",
+    "CHAT_ROOM_RATE": "100000",
+    "CHAT_ROOM_BURST": "100000",
+    "LIVE_GAME_SCHEDULER": "false",
+    "ARCHIVE_ENABLED": "false",
+}
+
+
+class Client:
+    def __init__(self, index: int, username: str, path: str, room: Tuple[str, int]) -> None:
+        self.index = index
+        self.username = username
+        self.path = path
+        self.room = room
+        self.websocket = None
+        self.connect_seconds: Optional[float] = None
+        self.sent = 0
+
+
+class LoadRun:
+    def __init__(self, args: argparse.Namespace, base_url: str, clients: List[Client]) -> None:
+        self.args = args
+        self.base_url = base_url
+        self.clients = clients
+        self.room_sizes: Dict[Tuple[str, int], int] = defaultdict(int)
+        for client in clients:
+            self.room_sizes[client.room] += 1
+        self.latencies: List[float] = []
+        self.expected_deliveries = 0
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sending = False
+
+    async def connect_all(self) -> None:
+        gate = asyncio.Semaphore(self.args.connect_concurrency)
+
+        async def connect(client: Client) -> None:
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    client.websocket = await websockets.connect(
+                        self.base_url + client.path, max_size=None, ping_interval=None
+                    )
+                    while json.loads(await client.websocket.recv()).get("type") != "welcome":
+                        pass
+                except Exception as exc:
+                    self.errors[f"connect: {type(exc).__name__}"] += 1
+                    client.websocket = None
+                    return
+                client.connect_seconds = time.perf_counter() - started
+
+        await asyncio.gather(*(connect(client) for client in self.clients))
+
+    async def receive(self, client: Client) -> None:
+        try:
+            async for raw in client.websocket:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+                if kind == "chat_message" and frame.get("content", "").startswith("load "):
+                    sent_at = float(frame["content"].rsplit(" ", 1)[1])
+                    self.latencies.append(time.perf_counter() - sent_at)
+                elif kind == "ping":
+                    await client.websocket.send(json.dumps({"type": "pong"}))
+                elif kind in ("error", "rate_limited"):
+                    self.errors[kind] += 1
+        except websockets.ConnectionClosed:
+            if self.sending:
+                self.errors["closed during run"] += 1
+
+    async def send(self, client: Client, interval: float, deadline: float) -> None:
+        next_send = time.perf_counter()
+        while True:
+            next_send += interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if time.perf_counter() >= deadline:
+                return
+            client.sent += 1
+            self.expected_deliveries += self.room_sizes[client.room]
+            content = f"load {client.index} {client.sent} {time.perf_counter():.9f}"
+            try:
+                await client.websocket.send(json.dumps({"content": content}))
+            except websockets.ConnectionClosed:
+                return
+
+    async def drive(self) -> None:
+        connected = [client for client in self.clients if client.websocket is not None]
+        senders = connected[: max(1, round(len(connected) * self.args.sender_share))]
+        interval = len(senders) / self.args.rate
+        receivers = [asyncio.create_task(self.receive(client)) for client in connected]
+
+        self.sending = True
+        deadline = time.perf_counter() + self.args.duration
+        await asyncio.gather(*(self.send(client, interval, deadline) for client in senders))
+        # Let the last messages arrive before tearing down.
+        await asyncio.sleep(self.args.drain)
+        self.sending = False
+
+        await asyncio.gather(*(client.websocket.close() for client in connected), return_exceptions=True)
+        for task in receivers:
+            task.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(database_url: str, args: argparse.Namespace) -> List[Client]:
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    teams = FAN_ROOM_TEAM_NAMES[: args.fan_rooms]
+    with session_factory() as db:
+        rooms = [FanRoom(team_name=team) for team in teams]
+        games = [
+            LiveGame(home_team=teams[index % len(teams)], away_team="Visitors", match_date=datetime.utcnow())
+            for index in range(args.live_games)
+        ]
+        db.add_all(rooms + games)
+        db.flush()
+
+        clients = []
+        live_clients = round(args.clients * args.live_share) if games else 0
+        for index in range(args.clients):
+            username = f"load_{index}"
+            if index < live_clients:
+                game = games[index % len(games)]
+                team, path, room = game.home_team, f"/livegames/ws/{game.id}", ("livegame", game.id)
+            else:
+                fan_room = rooms[index % len(rooms)]
+                team, path, room = fan_room.team_name, f"/fanrooms/ws/{fan_room.id}", ("fanroom", fan_room.id)
+            db.add(
+                User(
+                    user_id=uuid.uuid4().bytes,
+                    first_name="Load",
+                    last_name=str(index),
+                    username=username,
+                    email=f"{username}@example.com",
+                    password_hash="x",
+                    favorite_team=team,
+                )
+            )
+            clients.append(Client(index, username, path, room))
+        db.commit()
+    engine.dispose()
+
+    for client in clients:
+        client.path += f"?token={create_access_token({'sub': client.username})}"
+    return clients
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, **SERVER_ENV, "DATABASE_URL": database_url}
+    # The app needs a key to import; load traffic never mentions FootyBot.
+    env.setdefault("OPENAI_API_KEY", "load-test")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not start within 30 seconds")
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of a process, or None if it can't be read."""
+    if psutil is not None:
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # Fields after the parenthesised command name; utime and stime are 14 and 15.
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if len(samples) < 2:
+        value = round(samples[0] * 1000, 3) if samples else None
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": round(cuts[49] * 1000, 3),
+        "p95": round(cuts[94] * 1000, 3),
+        "p99": round(cuts[98] * 1000, 3),
+        "max": round(max(samples) * 1000, 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace, clients: List[Client], port: int, server_pid: int) -> dict:
+    load = LoadRun(args, f"ws://127.0.0.1:{port}", clients)
+    await load.connect_all()
+    connected = [client for client in clients if client.connect_seconds is not None]
+
+    cpu_before, wall_before = cpu_seconds(server_pid), time.perf_counter()
+    await load.drive()
+    cpu_after, wall = cpu_seconds(server_pid), time.perf_counter() - wall_before
+
+    server_cpu = None
+    if cpu_before is not None and cpu_after is not None:
+        server_cpu = {
+            "seconds": round(cpu_after - cpu_before, 3),
+            "percent": round((cpu_after - cpu_before) / wall * 100, 1),
+        }
+    sent = sum(client.sent for client in clients)
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "config": {
+            "clients": args.clients,
+            "fan_rooms": args.fan_rooms,
+            "live_games": args.live_games,
+            "live_share": args.live_share,
+            "sender_share": args.sender_share,
+            "rate": args.rate,
+            "duration": args.duration,
+        },
+        "connected": len(connected),
+        "connect_ms": percentiles([client.connect_seconds for client in connected]),
+        "messages_sent": sent,
+        "send_rate": round(sent / args.duration, 1),
+        "deliveries": len(load.latencies),
+        "delivery_ratio": round(len(load.latencies) / load.expected_deliveries, 4) if load.expected_deliveries else None,
+        "delivery_ms": percentiles(load.latencies),
+        "server_cpu": server_cpu,
+        "errors": dict(load.errors),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--clients", type=int, default=200, help="simulated websocket clients")
+    parser.add_argument("--fan-rooms", type=int, default=4, help="fan rooms the fan room clients spread over")
+    parser.add_argument("--live-games", type=int, default=2, help="live games the live game clients spread over")
+    parser.add_argument("--live-share", type=float, default=0.5, help="fraction of clients in live games")
+    parser.add_argument("--sender-share", type=float, default=0.1, help="fraction of clients that send chat")
+    parser.add_argument("--rate", type=float, default=50, help="total chat messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=2, help="seconds to wait for deliveries after sending")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="connects in flight at once")
+    parser.add_argument("--label", default=None, help="free-form name stored with the results")
+    parser.add_argument("--output", default=None, help="write the JSON here as well as to stdout")
+    args = parser.parse_args()
+    if args.fan_rooms < 1 or args.clients < 1 or args.rate <= 0:
+        parser.error("--clients, --fan-rooms and --rate must be positive")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        clients = seed(database_url, args)
+        port = free_port()
+        server = start_server(database_url, port)
+        try:
+            results = asyncio.run(run(args, clients, port, server.pid))
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as results_file:
+            results_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
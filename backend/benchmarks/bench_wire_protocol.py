@@ -0,0 +1,151 @@
+"""
+Benchmark: bandwidth and CPU of the websocket wire formats.
+
+Replays a matchday-shaped frame stream (chat bursts around goals, presence
+updates, the odd FootyBot reply) through each format a client can negotiate:
+- json: the default text frames
+- msgpack: ``footysocial.msgpack`` binary frames
+- either one with permessage-deflate, emulated with zlib the way the
+  websockets library does it (raw deflate, context takeover, sync flush)
+
+The stream is generated from a fixed seed so runs are comparable. Encoding
+happens once per broadcast, but deflate runs once per connection, so its
+cost is paid for every recipient.
+
+Run from the backend directory:
+    python -m benchmarks.bench_wire_protocol
+"""
+
+import json
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from broadcast import FrameFormat, encode_frame_as, msgpack
+
+FRAMES = 20_000
+SEED = 1886
+
+PHRASES = [
+    "What a strike!",
+    "GOAAAAL ⚽🔥",
+    "Ref you're having a laugh",
+    "That's never a penalty",
+    "Get him off, he's been rubbish all game",
+    "Best midfield in the league and it isn't close",
+    "VAR checking... again",
+    "Come on lads, one more!",
+    "How did he miss that from two yards??",
+    "Clean sheet incoming",
+]
+USERNAMES = [f"fan_{index}" for index in range(400)]
+
+
+def matchday_stream() -> List[dict]:
+    rng = random.Random(SEED)
+    kickoff = datetime(2026, 3, 14, 15, 0)
+    user_ids = {name: f"{rng.getrandbits(128):032x}" for name in USERNAMES}
+    frames, message_id, active_users = [], 1_000_000, 12_000
+    # Goals make the chat spike for a couple of minutes.
+    goals = sorted(rng.sample(range(1, 95), 3))
+    for index in range(FRAMES):
+        minute = index * 95 / FRAMES
+        created_at = kickoff + timedelta(minutes=minute)
+        roll = rng.random()
+        if roll < 0.05:
+            active_users += rng.randint(-40, 60)
+            frames.append({"type": "presence", "game_id": 42, "active_users": active_users})
+            continue
+        message_id += 1
+        username = rng.choice(USERNAMES)
+        near_goal = any(0 <= minute - goal < 2 for goal in goals)
+        content = rng.choice(PHRASES[:3] if near_goal else PHRASES)
+        frame = {
+            "type": "chat_message",
+            "message_id": message_id,
+            "game_id": 42,
+            "user_id": user_ids[username],
+            "username": username,
+            "content": content,
+            "created_at": created_at.isoformat(),
+        }
+        if roll > 0.995:
+            frame.update(user_id="bot", username="FootyBot", is_bot=True, content="FootyBot: " + content * 3)
+        frames.append(frame)
+    return frames
+
+
+class PerMessageDeflate:
+    """Server-side permessage-deflate for one connection, with context takeover."""
+
+    def __init__(self) -> None:
+        self.compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        # RFC 7692: drop the empty stored block's 00 00 ff ff tail.
+        return data[:-4]
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data + b"\x00\x00\xff\xff")
+
+
+def run(frames: List[dict], frame_format: FrameFormat, deflate: bool):
+    decode: Callable[[bytes], object] = msgpack.unpackb if frame_format is FrameFormat.MSGPACK else json.loads
+    channel: Optional[PerMessageDeflate] = PerMessageDeflate() if deflate else None
+    wire_bytes, encode_seconds, compress_seconds, client_seconds = 0, 0.0, 0.0, 0.0
+    for payload in frames:
+        start = time.perf_counter()
+        frame = encode_frame_as(frame_format, payload)
+        data = frame.encode("utf-8") if isinstance(frame, str) else frame
+        encoded = time.perf_counter()
+        if channel is not None:
+            data = channel.compress(data)
+        compressed = time.perf_counter()
+        wire_bytes += len(data)
+
+        if channel is not None:
+            decode(channel.decompress(data))
+        else:
+            decode(data)
+        client_seconds += time.perf_counter() - compressed
+        encode_seconds += encoded - start
+        compress_seconds += compressed - encoded
+    return wire_bytes, encode_seconds, compress_seconds, client_seconds
+
+
+def main() -> None:
+    frames = matchday_stream()
+    formats = [FrameFormat.JSON]
+    if msgpack is not None:
+        formats.append(FrameFormat.MSGPACK)
+    else:
+        print("msgpack not installed; only JSON is measured.", file=sys.stderr)
+
+    header = (
+        f"{'format':>16} {'bytes/frame':>12} {'vs json':>8} {'encode us':>10} "
+        f"{'deflate us/conn':>16} {'client us':>10}"
+    )
+    print(f"{len(frames)} frames")
+    print(header)
+    print("-" * len(header))
+    baseline = None
+    for frame_format in formats:
+        for deflate in (False, True):
+            wire_bytes, encode_seconds, compress_seconds, client_seconds = run(frames, frame_format, deflate)
+            baseline = baseline or wire_bytes
+            name = frame_format.value + ("+deflate" if deflate else "")
+            per_frame = 1_000_000 / len(frames)
+            deflate_us = f"{compress_seconds * per_frame:.2f}" if deflate else "-"
+            print(
+                f"{name:>16} {wire_bytes / len(frames):>12.1f} {wire_bytes / baseline:>7.0%} "
+                f"{encode_seconds * per_frame:>10.2f} {deflate_us:>16} {client_seconds * per_frame:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""
+Concurrent broadcast engine for the websocket connection managers.
+
+Every connection gets a bounded outbound queue drained by its own writer task,
+so a slow client only ever delays itself. Broadcasting a frame to a room is a
+non-blocking enqueue onto each member's queue; the writer tasks do the actual
+sends concurrently. Frames are serialised once per broadcast and the same text
+buffer is shared by every recipient.
+
+Every ``WS_HEARTBEAT_INTERVAL_SECONDS`` the engine pings each room with a
+``{"type": "ping"}`` frame; any frame from the client, such as the
+``{"type": "pong"}`` reply, counts as a sign of life. Sockets silent for
+``WS_HEARTBEAT_TIMEOUT_SECONDS`` are reaped in batches, closed, and handed to
+the manager's connection-lost callback like any other dead writer.
+
+Clients may ask for MessagePack frames instead of JSON, with the
+``footysocial.msgpack`` subprotocol or ``?format=msgpack``. A broadcast is
+then encoded at most once per format.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Coroutine, Deque, Dict, Hashable, List, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config import settings
+from metrics import LatencyStats, MetricsWriter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional binary protocol
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to clients that cannot keep up ("Try Again Later").
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Close code sent to sockets that stopped answering heartbeats ("Going Away").
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 1001
+
+PING_FRAME = {"type": "ping"}
+
+MSGPACK_SUBPROTOCOL = "footysocial.msgpack"
+
+
+def encode_frame(payload: Any) -> str:
+    """Serialise a frame to JSON text, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    # Same compact form Starlette's send_json produces.
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+class FrameFormat(str, Enum):
+    """Wire encoding of a connection's outbound frames."""
+
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+
+def encode_frame_as(frame_format: FrameFormat, payload: Any) -> Union[str, bytes]:
+    if frame_format is FrameFormat.MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return encode_frame(payload)
+
+
+def negotiate_frame_format(websocket: WebSocket) -> Tuple[FrameFormat, Optional[str]]:
+    """Pick the connection's frame format; returns it and the subprotocol to accept."""
+    if msgpack is not None:
+        if MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+            return FrameFormat.MSGPACK, MSGPACK_SUBPROTOCOL
+        if websocket.query_params.get("format") == FrameFormat.MSGPACK.value:
+            return FrameFormat.MSGPACK, None
+    return FrameFormat.JSON, None
+
+
+INVALID_FRAME = {"type": "error", "message": "Could not read that message."}
+
+
+async def receive_payload(
+    websocket: WebSocket,
+    reject: Callable[[Dict[str, Any]], Awaitable[Any]],
+) -> Dict[str, Any]:
+    """
+    Read the next client frame: a JSON text frame, or MessagePack in a binary
+    frame. Frames that don't decode to an object are answered with an error
+    frame through ``reject`` and skipped.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        data = message.get("bytes")
+        try:
+            if data is not None and msgpack is not None:
+                payload = msgpack.unpackb(data, raw=False)
+            else:
+                payload = json.loads(message.get("text") or data)
+        except (ValueError, TypeError):
+            # Covers JSONDecodeError, bad UTF-8 and msgpack's unpack errors.
+            payload = None
+        if isinstance(payload, dict):
+            return payload
+        await reject(INVALID_FRAME)
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a connection's outbound queue is full."""
+
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+class FanoutStats(LatencyStats):
+    """Fan-out latency for a single room, plus the frames dropped for slow clients."""
+
+    __slots__ = ("dropped",)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.dropped = 0
+
+    def merge(self, other: "FanoutStats") -> None:
+        """Fold another room's figures into these, e.g. to total a game's shards."""
+        self.count += other.count
+        self.total_seconds += other.total_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.dropped += other.dropped
+
+    def as_dict(self) -> Dict[str, Any]:
+        latency = super().as_dict()
+        return {
+            "frames_sent": latency["count"],
+            "frames_dropped": self.dropped,
+            "avg_latency_ms": latency["avg_ms"],
+            "max_latency_ms": latency["max_ms"],
+        }
+
+
+class ConnectionWriter:
+    """Bounded outbound queue plus the task that drains it for one websocket."""
+
+    def __init__(
+        self,
+        engine: "BroadcastEngine",
+        room_id: int,
+        websocket: WebSocket,
+        max_queue_size: int,
+        policy: SlowConsumerPolicy,
+        frame_format: FrameFormat = FrameFormat.JSON,
+    ) -> None:
+        self.engine = engine
+        self.room_id = room_id
+        self.websocket = websocket
+        self.frame_format = frame_format
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        # Entries are (coalesce_key, encoded frame, enqueued_at).
+        self.queue: Deque[Tuple[Optional[Hashable], Union[str, bytes], float]] = deque()
+        self.closed = False
+        # Monotonic time of the last frame received from the client.
+        self.last_seen = time.monotonic()
+        # Room frames set aside while a reconnect replay is being loaded, as
+        # (coalesce_key, encoded frame, message_id); None when not replaying.
+        self.held: Optional[List[Tuple[Optional[Hashable], Union[str, bytes], Optional[int]]]] = None
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    def enqueue(self, frame: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Queue an encoded frame for this connection. Returns False if it was dropped."""
+        if self.closed:
+            return False
+
+        now = time.perf_counter()
+
+        if coalesce_key is not None and self.policy is SlowConsumerPolicy.COALESCE:
+            # A newer frame of the same kind supersedes one still waiting to go out.
+            for index, (key, _, enqueued_at) in enumerate(self.queue):
+                if key == coalesce_key:
+                    self.queue[index] = (coalesce_key, frame, enqueued_at)
+                    return True
+
+        if len(self.queue) >= self.max_queue_size:
+            if self.policy is SlowConsumerPolicy.DISCONNECT:
+                self._close_slow_consumer()
+                return False
+            self.queue.popleft()
+            self.engine.record_drop(self.room_id)
+
+        self.queue.append((coalesce_key, frame, now))
+        self._wakeup.set()
+        return True
+
+    def hold(self, frame: Union[str, bytes], coalesce_key: Optional[Hashable], message_id: Optional[int]) -> None:
+        """Set a room frame aside until the replay is sent. Bounded like the send queue."""
+        if len(self.held) >= self.max_queue_size:
+            self.held.pop(0)
+            self.engine.record_drop(self.room_id)
+        self.held.append((coalesce_key, frame, message_id))
+
+    def close(self) -> None:
+        """Stop the writer task; pending frames are discarded."""
+        self.closed = True
+        self.queue.clear()
+        self._wakeup.set()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def _close_slow_consumer(self) -> None:
+        logger.warning(
+            "Disconnecting slow consumer in room %s (%s frames queued)",
+            self.room_id,
+            len(self.queue),
+        )
+        self.engine.record_drop(self.room_id, len(self.queue) + 1)
+        self.queue.clear()
+        self.closed = True
+        self._wakeup.set()
+        self.engine.spawn_close(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Slow consumer")
+        except Exception:
+            pass
+        self.engine.handle_writer_failure(self.room_id, self.websocket)
+
+    async def _run(self) -> None:
+        while not self.closed:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, frame, enqueued_at = self.queue.popleft()
+            try:
+                if self.frame_format is FrameFormat.MSGPACK:
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Connection is already closed; drop it.
+                self.closed = True
+                self.engine.handle_writer_failure(self.room_id, self.websocket)
+                return
+            self.engine.record_latency(self.room_id, time.perf_counter() - enqueued_at)
+
+
+class BroadcastEngine:
+    """Fan frames out to every connection in a room without serialising sends."""
+
+    def __init__(
+        self,
+        max_queue_size: Optional[int] = None,
+        policy: Optional[SlowConsumerPolicy] = None,
+        on_connection_lost: Optional[Callable[[int, WebSocket], None]] = None,
+    ) -> None:
+        self.max_queue_size = max_queue_size or settings.BROADCAST_QUEUE_SIZE
+        self.policy = SlowConsumerPolicy(policy or settings.BROADCAST_SLOW_CONSUMER_POLICY)
+        self.on_connection_lost = on_connection_lost
+        self.writers: Dict[int, Dict[WebSocket, ConnectionWriter]] = defaultdict(dict)
+        self.stats: Dict[int, FanoutStats] = defaultdict(FanoutStats)
+        # Enqueue-to-send time across every room, for the /metrics histogram.
+        self.latency = LatencyStats()
+        self.heartbeat_interval = settings.WS_HEARTBEAT_INTERVAL_SECONDS
+        self.heartbeat_timeout = settings.WS_HEARTBEAT_TIMEOUT_SECONDS
+        self.reap_batch_size = settings.WS_REAP_BATCH_SIZE
+        self.reaped = 0
+        # Lifetime totals for /metrics. Per-room stats go away with the room,
+        # so counters read from them would appear to reset.
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    def register(
+        self,
+        room_id: int,
+        websocket: WebSocket,
+        frame_format: FrameFormat = FrameFormat.JSON,
+    ) -> ConnectionWriter:
+        writer = ConnectionWriter(self, room_id, websocket, self.max_queue_size, self.policy, frame_format)
+        self.writers[room_id][websocket] = writer
+        writer.start()
+        return writer
+
+    def unregister(self, room_id: int, websocket: WebSocket) -> None:
+        room_writers = self.writers.get(room_id)
+        if not room_writers:
+            return
+        writer = room_writers.pop(websocket, None)
+        if writer is not None:
+            writer.close()
+        if not room_writers:
+            self.writers.pop(room_id, None)
+            stats = self.stats.pop(room_id, None)
+            if stats is not None and stats.count:
+                logger.info("Room %s fan-out summary: %s", room_id, stats.as_dict())
+
+    def publish(self, room_id: int, payload: Any, coalesce_key: Optional[Hashable] = None) -> int:
+        """Queue a frame for every connection in the room; returns how many accepted it."""
+        room_writers = self.writers.get(room_id)
+        if not room_writers:
+            return 0
+
+        # Encode once per format; every writer shares the same immutable buffer.
+        frames: Dict[FrameFormat, Union[str, bytes]] = {}
+        delivered = 0
+        for writer in list(room_writers.values()):
+            frame = frames.get(writer.frame_format)
+            if frame is None:
+                frame = frames[writer.frame_format] = encode_frame_as(writer.frame_format, payload)
+            if writer.held is not None:
+                writer.hold(frame, coalesce_key, payload.get("message_id") if isinstance(payload, dict) else None)
+                delivered += 1
+            elif writer.enqueue(frame, coalesce_key):
+                delivered += 1
+        return delivered
+
+    async def replay(
+        self,
+        room_id: Hashable,
+        websocket: WebSocket,
+        load: Callable[[], Tuple[List[Dict[str, Any]], bool]],
+    ) -> None:
+        """
+        Send a reconnecting socket the chat it missed, then the room frames
+        that arrived meanwhile.
+
+        ``load`` returns ``(messages, complete)`` and runs in a worker thread,
+        so a reconnect storm doesn't stall every other socket. Room frames for
+        this socket are held until the replay is queued; chat the replay
+        already contained is dropped rather than sent twice.
+        """
+        writer = self.writers.get(room_id, {}).get(websocket)
+        if writer is None:
+            return
+        writer.held = []
+        missed: List[Dict[str, Any]] = []
+        try:
+            missed, complete = await asyncio.to_thread(load)
+            for message in missed:
+                self.send_to(room_id, websocket, {"type": "chat_message", **message})
+            self.send_to(room_id, websocket, {"type": "replay", "count": len(missed), "complete": complete})
+        finally:
+            held, writer.held = writer.held, None
+            replayed = {message["message_id"] for message in missed}
+            for coalesce_key, frame, message_id in held:
+                if message_id is None or message_id not in replayed:
+                    writer.enqueue(frame, coalesce_key)
+
+    def send_to(self, room_id: int, websocket: WebSocket, payload: Any) -> bool:
+        """Queue a frame for a single connection, keeping it ordered with broadcasts."""
+        writer = self.writers.get(room_id, {}).get(websocket)
+        if writer is None:
+            return False
+        return writer.enqueue(encode_frame_as(writer.frame_format, payload))
+
+    def touch(self, room_id: int, websocket: WebSocket) -> None:
+        """Note that the client just sent a frame."""
+        writer = self.writers.get(room_id, {}).get(websocket)
+        if writer is not None:
+            writer.last_seen = time.monotonic()
+
+    async def start_heartbeat(self) -> None:
+        if self.heartbeat_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def stop_heartbeat(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.reap(time.monotonic())
+            except Exception:
+                logger.exception("Websocket heartbeat pass failed")
+
+    async def reap(self, now: float) -> int:
+        """Ping every room and close the sockets that missed their heartbeats."""
+        stale = []
+        for room_id, room_writers in list(self.writers.items()):
+            for websocket, writer in room_writers.items():
+                if now - writer.last_seen > self.heartbeat_timeout:
+                    stale.append((room_id, websocket))
+            self.publish(room_id, PING_FRAME, coalesce_key="ping")
+
+        for start in range(0, len(stale), self.reap_batch_size):
+            for room_id, websocket in stale[start:start + self.reap_batch_size]:
+                self._reap_connection(room_id, websocket)
+            # Let the loop breathe between batches during a mass timeout.
+            await asyncio.sleep(0)
+        if stale:
+            self.reaped += len(stale)
+            logger.info("Reaped %s unresponsive websockets", len(stale))
+        return len(stale)
+
+    def _reap_connection(self, room_id: int, websocket: WebSocket) -> None:
+        if websocket not in self.writers.get(room_id, {}):
+            return
+        # The manager unregisters the socket and schedules one presence
+        # update for the room, however many of its sockets are reaped.
+        self.handle_writer_failure(room_id, websocket)
+        self.spawn_close(self._close_stale(websocket))
+
+    def spawn_close(self, close: Coroutine) -> None:
+        """Run a socket close in the background, keeping a reference until it ends."""
+        task = asyncio.create_task(close)
+        self._closing.add(task)
+        task.add_done_callback(self._close_done)
+
+    def _close_done(self, task: asyncio.Task) -> None:
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Closing a websocket failed", exc_info=task.exception())
+
+    async def _close_stale(self, websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=HEARTBEAT_TIMEOUT_CLOSE_CODE, reason="Heartbeat timeout"),
+                timeout=self.heartbeat_timeout,
+            )
+        except Exception:
+            pass
+
+    def handle_writer_failure(self, room_id: int, websocket: WebSocket) -> None:
+        if self.on_connection_lost is not None:
+            self.on_connection_lost(room_id, websocket)
+        else:
+            self.unregister(room_id, websocket)
+
+    def record_latency(self, room_id: int, seconds: float) -> None:
+        self.stats[room_id].record(seconds)
+        self.latency.record(seconds)
+        self.frames_sent += 1
+
+    def record_drop(self, room_id: int, count: int = 1) -> None:
+        self.stats[room_id].dropped += count
+        self.frames_dropped += count
+
+    def get_fanout_stats(self, room_id: Hashable, *more_room_ids: Hashable) -> Dict[str, Any]:
+        """Fan-out figures for a room, or the totals across several."""
+        totals = FanoutStats()
+        for key in (room_id, *more_room_ids):
+            stats = self.stats.get(key)
+            if stats is not None:
+                totals.merge(stats)
+        return totals.as_dict()
+
+    def get_queue_depth(self, room_id: int) -> int:
+        return sum(len(writer.queue) for writer in self.writers.get(room_id, {}).values())
+
+    def collect_metrics(
+        self,
+        metrics: MetricsWriter,
+        labels: Dict[str, str],
+        room_labels: Callable[[Hashable], Dict[str, Any]],
+    ) -> None:
+        """Write per-room connection and queue gauges, lifetime frame counters and the latency histogram."""
+        for room_id, room_writers in list(self.writers.items()):
+            room = {**labels, **room_labels(room_id)}
+            depths = [len(writer.queue) for writer in room_writers.values()]
+            metrics.gauge("footysocial_ws_connections", "Open websockets per room.", len(room_writers), room)
+            metrics.gauge("footysocial_ws_send_queue_depth", "Frames queued for a room's sockets.", sum(depths), room)
+            metrics.gauge(
+                "footysocial_ws_send_queue_max_depth",
+                "Longest single send queue in a room.",
+                max(depths, default=0),
+                room,
+            )
+        metrics.counter("footysocial_ws_frames_sent", "Frames written to sockets.", self.frames_sent, labels)
+        metrics.counter("footysocial_ws_frames_dropped", "Frames dropped for slow clients.", self.frames_dropped, labels)
+        metrics.counter("footysocial_ws_reaped", "Sockets closed for missing heartbeats.", self.reaped, labels)
+        metrics.histogram(
+            "footysocial_ws_fanout_latency_seconds",
+            "Time from enqueueing a frame to writing it to the socket.",
+            self.latency.histogram,
+            labels,
+        )
+
+
+class RoomDebouncer:
+    """
+    Run a per-room callback at most once per interval.
+
+    The first request in a quiet room fires on the next loop iteration; any
+    further requests inside the interval collapse into a single trailing call,
+    which reads whatever state is current when it runs.
+    """
+
+    def __init__(self, interval: float, callback: Callable[[int], Union[Awaitable[None], None]]) -> None:
+        self.interval = interval
+        self.callback = callback
+        self.last_run: Dict[int, float] = {}
+        self.scheduled: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def request(self, room_id: int) -> None:
+        if room_id in self.scheduled:
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, self.last_run.get(room_id, float("-inf")) + self.interval - loop.time())
+        self.scheduled[room_id] = loop.call_later(delay, self._fire, room_id)
+
+    def cancel(self, room_id: int) -> None:
+        handle = self.scheduled.pop(room_id, None)
+        if handle is not None:
+            handle.cancel()
+        self.last_run.pop(room_id, None)
+
+    def _fire(self, room_id: int) -> None:
+        self.scheduled.pop(room_id, None)
+        self.last_run[room_id] = asyncio.get_running_loop().time()
+        result = self.callback(room_id)
+        if asyncio.iscoroutine(result):
+            task = asyncio.create_task(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
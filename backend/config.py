@@ -12,6 +12,92 @@ class Settings:
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Realtime broadcast
+    BROADCAST_QUEUE_SIZE: int = int(os.getenv("BROADCAST_QUEUE_SIZE", "256"))
+    BROADCAST_SLOW_CONSUMER_POLICY: str = os.getenv("BROADCAST_SLOW_CONSUMER_POLICY", "drop_oldest")
+    PRESENCE_INTERVAL_SECONDS: float = float(os.getenv("PRESENCE_INTERVAL_SECONDS", "1.0"))
+    # Most missed messages replayed to a socket reconnecting with last_message_id
+    RECONNECT_REPLAY_LIMIT: int = int(os.getenv("RECONNECT_REPLAY_LIMIT", "200"))
+    # Negotiate permessage-deflate with clients that offer it (uvicorn --ws-per-message-deflate)
+    WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    # Server pings every interval; sockets silent for the timeout are reaped (0 disables)
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "20"))
+    WS_HEARTBEAT_TIMEOUT_SECONDS: float = float(os.getenv("WS_HEARTBEAT_TIMEOUT_SECONDS", "60"))
+    WS_REAP_BATCH_SIZE: int = int(os.getenv("WS_REAP_BATCH_SIZE", "500"))
+    # How often the event loop's scheduling lag is sampled for /metrics
+    LOOP_LAG_INTERVAL_SECONDS: float = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+    # Cross-worker backplane: memory:// (single worker) or unix:///path/to/broker.sock
+    BACKPLANE_URL: str = os.getenv("BACKPLANE_URL", "memory://")
+    BACKPLANE_PRESENCE_INTERVAL: float = float(os.getenv("BACKPLANE_PRESENCE_INTERVAL", "10"))
+
+    # Chat flood control (token buckets: messages per second, burst size)
+    CHAT_USER_RATE: float = float(os.getenv("CHAT_USER_RATE", "1.0"))
+    CHAT_USER_BURST: float = float(os.getenv("CHAT_USER_BURST", "5"))
+    CHAT_ROOM_RATE: float = float(os.getenv("CHAT_ROOM_RATE", "50"))
+    CHAT_ROOM_BURST: float = float(os.getenv("CHAT_ROOM_BURST", "100"))
+
+    # Live game rooms opened from the fixture calendar (opt-in; needs the
+    # live_games.match_id / closed_at columns that startup migrations add)
+    LIVE_GAME_SCHEDULER: bool = os.getenv("LIVE_GAME_SCHEDULER", "false").lower() in ("1", "true", "yes")
+    LIVE_GAME_OPEN_BEFORE_MINUTES: int = int(os.getenv("LIVE_GAME_OPEN_BEFORE_MINUTES", "60"))
+    LIVE_GAME_CLOSE_AFTER_MINUTES: int = int(os.getenv("LIVE_GAME_CLOSE_AFTER_MINUTES", "150"))
+    LIVE_GAME_SCHEDULE_HORIZON_HOURS: int = int(os.getenv("LIVE_GAME_SCHEDULE_HORIZON_HOURS", "24"))
+
+    # Sharding of very large live game rooms
+    LIVE_GAME_SHARDING: bool = os.getenv("LIVE_GAME_SHARDING", "false").lower() == "true"
+    LIVE_GAME_SHARD_SIZE: int = int(os.getenv("LIVE_GAME_SHARD_SIZE", "2000"))
+    LIVE_GAME_CROSS_SHARD_RATE: float = float(os.getenv("LIVE_GAME_CROSS_SHARD_RATE", "2"))
+    LIVE_GAME_CROSS_SHARD_BURST: int = int(os.getenv("LIVE_GAME_CROSS_SHARD_BURST", "5"))
+
+    # Cold storage for old chat history (moves rows out of the message tables)
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "chat_archive")
+    ARCHIVE_FAN_ROOM_RETENTION_DAYS: int = int(os.getenv("ARCHIVE_FAN_ROOM_RETENTION_DAYS", "30"))
+    ARCHIVE_LIVE_GAME_RETENTION_DAYS: int = int(os.getenv("ARCHIVE_LIVE_GAME_RETENTION_DAYS", "7"))
+    ARCHIVE_INTERVAL_HOURS: float = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+
+    # FootyBot replies (generated in the background, dropped after the timeout)
+    FOOTYBOT_TIMEOUT_SECONDS: float = float(os.getenv("FOOTYBOT_TIMEOUT_SECONDS", "15"))
+    # Answers to repeated questions are reused per room for the TTL (0 disables)
+    FOOTYBOT_CACHE_TTL_SECONDS: float = float(os.getenv("FOOTYBOT_CACHE_TTL_SECONDS", "60"))
+    FOOTYBOT_CACHE_SIZE: int = int(os.getenv("FOOTYBOT_CACHE_SIZE", "1000"))
+    # Per-room chat context: rooms idle this long are dropped, and least
+    # recently active rooms go first once the total passes the memory cap
+    FOOTYBOT_HISTORY_IDLE_SECONDS: float = float(os.getenv("FOOTYBOT_HISTORY_IDLE_SECONDS", "3600"))
+    FOOTYBOT_HISTORY_MEMORY_BYTES: int = int(os.getenv("FOOTYBOT_HISTORY_MEMORY_BYTES", str(16 * 1024 * 1024)))
+    # Optional moderation word list (one term per line), reloaded when it changes
+    BADWORDS_FILE: str = os.getenv("BADWORDS_FILE", "")
+    BADWORDS_RELOAD_SECONDS: float = float(os.getenv("BADWORDS_RELOAD_SECONDS", "30"))
+
+    # Shared LLM scheduler (FootyBot, trivia): backend is "langchain" or "fake"
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "langchain")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Provider token budget per minute (0 disables)
+    LLM_TOKENS_PER_MINUTE: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "200"))
+    LLM_ROOM_QUEUE_LIMIT: int = int(os.getenv("LLM_ROOM_QUEUE_LIMIT", "10"))
+
+    # Websocket admission cache
+    ADMISSION_CACHE_TTL: float = float(os.getenv("ADMISSION_CACHE_TTL", "30"))
+    ADMISSION_CACHE_SIZE: int = int(os.getenv("ADMISSION_CACHE_SIZE", "50000"))
+    ADMISSION_CATALOG_TTL: float = float(os.getenv("ADMISSION_CATALOG_TTL", "300"))
+
+    # Write-behind chat persistence (opt-in, single worker only)
+    MESSAGE_WRITE_BEHIND: bool = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+    WRITE_BEHIND_MAX_LOSS_SECONDS: float = float(os.getenv("WRITE_BEHIND_MAX_LOSS_SECONDS", "1.0"))
+    WRITE_BEHIND_ID_BLOCK_SIZE: int = int(os.getenv("WRITE_BEHIND_ID_BLOCK_SIZE", "1000"))
+    WRITE_BEHIND_SPILL_PATH: str = os.getenv("WRITE_BEHIND_SPILL_PATH", "write_behind_spill.jsonl")
+    # Rows the database rejects even one at a time; kept for inspection, never retried
+    WRITE_BEHIND_DEAD_LETTER_PATH: str = os.getenv("WRITE_BEHIND_DEAD_LETTER_PATH", "write_behind_dead_letter.jsonl")
+    # Pending rows beyond this are spilled to disk until the database catches up
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "100000"))
+
+    # Recent-message ring buffers serving history without SQL
+    MESSAGE_BUFFER_SIZE: int = int(os.getenv("MESSAGE_BUFFER_SIZE", "500"))
+    MESSAGE_BUFFER_MEMORY_BYTES: int = int(os.getenv("MESSAGE_BUFFER_MEMORY_BYTES", str(64 * 1024 * 1024)))
+
     # Environment
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
 
@@ -0,0 +1,286 @@
+"""
+One in-process queue in front of every LLM call.
+
+FootyBot replies and trivia generation used to call OpenAI directly with no
+limit, so a busy matchday could open hundreds of requests at once and trip
+the provider's rate limits for everyone. Calls now go through
+``llm_scheduler.run``, which:
+
+- runs at most ``LLM_MAX_CONCURRENCY`` requests at a time
+- spends an estimated token cost from a ``LLM_TOKENS_PER_MINUTE`` bucket
+  before each request, corrected from the reported usage afterwards
+- serves interactive requests (bot replies) before background ones (trivia)
+- round-robins between rooms within a priority, so one busy room can't
+  starve the rest, and sheds from the longest queue when the queue is full
+
+A caller cancelled while queued (e.g. a bot reply timing out) leaves the
+queue without ever reaching the provider. The backend that actually runs a
+request is pluggable: ``LLM_BACKEND=fake`` answers locally without a key.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+from config import settings
+from metrics import LatencyStats, MetricsWriter
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Rough characters per token, for estimating a request's cost up front.
+CHARS_PER_TOKEN = 4
+
+
+class LLMOverloaded(Exception):
+    """The request was shed because the LLM queue is full."""
+
+
+class LangChainBackend:
+    """Runs requests through the LangChain runnable the caller built."""
+
+    async def invoke(self, runnable: Any, request: Any) -> Any:
+        return await runnable.ainvoke(request)
+
+
+class FakeBackend:
+    """
+    Answers locally without calling a provider, for development and tests.
+
+    Without ``respond``, chat runnables get a canned ``AIMessage`` and
+    structured-output runnables get their schema with every field blank, so
+    callers take the same path they would for a useless model answer.
+    """
+
+    def __init__(self, respond: Optional[Callable[[Any, Any], Any]] = None, latency: float = 0.0) -> None:
+        self.respond = respond
+        self.latency = latency
+        self.calls = 0
+
+    async def invoke(self, runnable: Any, request: Any) -> Any:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.respond is not None:
+            return self.respond(runnable, request)
+        output_type = getattr(runnable, "OutputType", None)
+        if isinstance(output_type, type) and issubclass(output_type, BaseModel):
+            return output_type.model_construct(**{name: "" for name in output_type.model_fields})
+        return AIMessage(content="⚽ (FootyBot is running on a fake model.)")
+
+
+BACKENDS = {"langchain": LangChainBackend, "fake": FakeBackend}
+
+
+def estimate_tokens(*texts: str, max_tokens: int = 0) -> int:
+    """Prompt tokens estimated from the text, plus the completion limit."""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + max_tokens
+
+
+class Job:
+    __slots__ = ("priority", "room", "tokens", "queued_at", "ready")
+
+    def __init__(self, priority: int, room: Hashable, tokens: int, ready: asyncio.Future) -> None:
+        self.priority = priority
+        self.room = room
+        self.tokens = tokens
+        self.queued_at = time.monotonic()
+        self.ready = ready
+
+
+class LLMScheduler:
+    """Concurrency cap, token budget and fair priority queue for LLM calls."""
+
+    def __init__(
+        self,
+        backend: Any = None,
+        max_concurrency: Optional[int] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        room_queue_limit: Optional[int] = None,
+    ) -> None:
+        self.backend = backend or BACKENDS[settings.LLM_BACKEND]()
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        tokens_per_minute = settings.LLM_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute
+        self.token_rate = tokens_per_minute / 60
+        self.token_burst = tokens_per_minute
+        self.budget = TokenBucket(self.token_burst, time.monotonic()) if tokens_per_minute else None
+        self.max_queue = max_queue or settings.LLM_MAX_QUEUE
+        self.room_queue_limit = room_queue_limit or settings.LLM_ROOM_QUEUE_LIMIT
+
+        # One lane per priority; each maps room -> its queued jobs, in
+        # round-robin order (a served room moves to the back).
+        self.lanes: List["OrderedDict[Hashable, Deque[Job]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self.queued = 0
+        self.running = 0
+        self.queue_wait = {priority: LatencyStats() for priority in PRIORITY_NAMES}
+        self.counters: Dict[str, int] = {"completed": 0, "failed": 0, "shed": 0, "cancelled": 0}
+        self._budget_wakeup: Optional[asyncio.TimerHandle] = None
+
+    async def run(
+        self,
+        runnable: Any,
+        request: Any,
+        priority: int = BACKGROUND,
+        room: Hashable = None,
+        tokens: int = 0,
+    ) -> Any:
+        """
+        Queue a request and return the backend's result once it has run.
+
+        Raises ``LLMOverloaded`` if the request is shed instead.
+        """
+        job = Job(priority, room, tokens, asyncio.get_running_loop().create_future())
+        self._enqueue(job)
+        self._dispatch()
+        try:
+            await job.ready
+        except asyncio.CancelledError:
+            if job.ready.done() and not job.ready.cancelled() and job.ready.exception() is None:
+                # Granted a slot in the same tick the caller gave up. A job
+                # shed in that tick never held one, so there's nothing to free.
+                self._release()
+            else:
+                self._discard(job)
+            self.counters["cancelled"] += 1
+            raise
+
+        try:
+            result = await self.backend.invoke(runnable, request)
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            self._release()
+        self.counters["completed"] += 1
+        self._settle_tokens(job, result)
+        return result
+
+    def _enqueue(self, job: Job) -> None:
+        lane = self.lanes[job.priority]
+        queue = lane.get(job.room)
+        if queue is not None and len(queue) >= self.room_queue_limit:
+            self.counters["shed"] += 1
+            raise LLMOverloaded(f"Too many LLM requests queued for room {job.room}")
+        if self.queued >= self.max_queue and not self._shed_for(job):
+            self.counters["shed"] += 1
+            raise LLMOverloaded("LLM queue is full")
+        if queue is None:
+            queue = lane[job.room] = deque()
+        queue.append(job)
+        self.queued += 1
+
+    def _shed_for(self, job: Job) -> bool:
+        """Make room for a job by dropping the newest job of the longest queue
+        at the same or lower priority, unless that queue is the job's own."""
+        for priority in range(len(self.lanes) - 1, job.priority - 1, -1):
+            lane = self.lanes[priority]
+            if not lane:
+                continue
+            room, queue = max(lane.items(), key=lambda item: len(item[1]))
+            own = len(lane.get(job.room, ())) + 1 if priority == job.priority else 0
+            if len(queue) <= own:
+                continue
+            victim = queue.pop()
+            if not queue:
+                del lane[room]
+            self.queued -= 1
+            self.counters["shed"] += 1
+            victim.ready.set_exception(LLMOverloaded("Shed for a higher-priority or quieter room"))
+            return True
+        return False
+
+    def _discard(self, job: Job) -> None:
+        queue = self.lanes[job.priority].get(job.room)
+        if queue is not None and job in queue:
+            queue.remove(job)
+            if not queue:
+                del self.lanes[job.priority][job.room]
+            self.queued -= 1
+
+    def _next_job(self) -> Optional[Job]:
+        for lane in self.lanes:
+            if lane:
+                return next(iter(lane.values()))[0]
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            if self.budget is not None:
+                now = time.monotonic()
+                wait = self.budget.take(self.token_rate, self.token_burst, now, min(job.tokens, self.token_burst))
+                if wait:
+                    self._wake_after(wait)
+                    return
+
+            lane = self.lanes[job.priority]
+            queue = lane[job.room]
+            queue.popleft()
+            if queue:
+                lane.move_to_end(job.room)
+            else:
+                del lane[job.room]
+            self.queued -= 1
+            self.running += 1
+            self.queue_wait[job.priority].record(time.monotonic() - job.queued_at)
+            job.ready.set_result(None)
+
+    def _wake_after(self, delay: float) -> None:
+        if self._budget_wakeup is not None:
+            return
+
+        def wake() -> None:
+            self._budget_wakeup = None
+            self._dispatch()
+
+        self._budget_wakeup = asyncio.get_running_loop().call_later(delay, wake)
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._dispatch()
+
+    def _settle_tokens(self, job: Job, result: Any) -> None:
+        # Chat models report real usage; give back (or charge) the difference.
+        usage = getattr(result, "usage_metadata", None)
+        if self.budget is None or not usage or "total_tokens" not in usage:
+            return
+        charged = min(job.tokens, self.token_burst)
+        self.budget.tokens = min(self.token_burst, self.budget.tokens + charged - usage["total_tokens"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "running": self.running,
+            "queued": self.queued,
+            "queue_wait": {PRIORITY_NAMES[priority]: stats.as_dict() for priority, stats in self.queue_wait.items()},
+        }
+
+    def collect_metrics(self, metrics: MetricsWriter) -> None:
+        metrics.gauge("footysocial_llm_running", "LLM requests in progress.", self.running)
+        for priority, name in PRIORITY_NAMES.items():
+            queued = sum(len(queue) for queue in self.lanes[priority].values())
+            metrics.gauge("footysocial_llm_queued", "LLM requests waiting for a slot.", queued, {"priority": name})
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.histogram(
+                "footysocial_llm_queue_wait_seconds",
+                "Time LLM requests spent queued.",
+                self.queue_wait[priority].histogram,
+                {"priority": name},
+            )
+        for outcome, count in self.counters.items():
+            metrics.counter("footysocial_llm_requests", "LLM requests by outcome.", count, {"outcome": outcome})
+
+
+llm_scheduler = LLMScheduler()
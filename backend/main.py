@@ -1,18 +1,27 @@
 import os
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
 from database import engine, get_db, SessionLocal
 from models import Base
+from migrations import upgrade_schema
 from routers import auth, users, trivia, standings, gifs
 from routers import fanrooms as fanroom_router
 from routers import fixtures as fixtures_router
 from routers import livegame as livegame_router
-from routers.fanrooms import ensure_fan_rooms_exist
+from routers.fanrooms import ensure_bot_user_exists, ensure_fan_rooms_exist
 from config import settings
-from routers.chatbot import initialize_chatbot
+from backplane import backplane
+from message_store import commit_latency, write_behind
+from metrics import CONTENT_TYPE, MetricsWriter, loop_monitor
+from ratelimit import chat_rate_limiter
+from admission import admission_cache
+from archive import ArchiveJob
+from llm_scheduler import llm_scheduler
+from routers.chatbot import chatbot_manager, initialize_chatbot
 
-# Create database tables
+# Create database tables, then add columns and indexes missing from older ones
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 # Create FastAPI app
 app = FastAPI(
@@ -43,9 +52,94 @@ app.include_router(livegame_router.router)
 
 @app.on_event("startup")
 def bootstrap_fan_rooms():
-    """Ensure the default fan rooms exist."""
+    """Ensure the default fan rooms and FootyBot's account exist."""
     with SessionLocal() as db:
         ensure_fan_rooms_exist(db)
+        ensure_bot_user_exists(db)
+
+
+@app.on_event("startup")
+async def start_backplane():
+    """Connect this worker to the cross-worker pub/sub backplane."""
+    await backplane.start()
+
+
+@app.on_event("startup")
+async def start_live_game_scheduler():
+    """Open and close live game rooms around fixture kickoffs."""
+    if settings.LIVE_GAME_SCHEDULER:
+        await livegame_router.scheduler.start()
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """Sample how long the event loop is blocked."""
+    await loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    """Stop sampling event loop lag."""
+    await loop_monitor.stop()
+
+
+@app.on_event("startup")
+async def start_websocket_heartbeats():
+    """Ping websockets and reap the ones that stop answering."""
+    await fanroom_router.manager.engine.start_heartbeat()
+    await livegame_router.manager.engine.start_heartbeat()
+
+
+archive_job = ArchiveJob([fanroom_router.archive_fan_room_days, livegame_router.archive_live_games])
+
+
+@app.on_event("startup")
+async def start_archive_job():
+    """Move old fan room days and finished games' chat to cold storage."""
+    if settings.ARCHIVE_ENABLED:
+        await archive_job.start()
+
+
+@app.on_event("shutdown")
+async def stop_archive_job():
+    """Stop the cold-storage job."""
+    await archive_job.stop()
+
+
+@app.on_event("shutdown")
+async def stop_websocket_heartbeats():
+    """Stop the websocket heartbeat timers."""
+    await fanroom_router.manager.engine.stop_heartbeat()
+    await livegame_router.manager.engine.stop_heartbeat()
+
+
+@app.on_event("shutdown")
+async def stop_live_game_scheduler():
+    """Stop the live game room timers."""
+    await livegame_router.scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def stop_backplane():
+    """Announce this worker's exit and disconnect from the backplane."""
+    await backplane.stop()
+
+
+@app.on_event("startup")
+async def start_write_behind():
+    """Start the batched chat-message flusher when write-behind is enabled."""
+    if write_behind is not None:
+        if not settings.BACKPLANE_URL.startswith("memory://"):
+            print("⚠️  WARNING: MESSAGE_WRITE_BEHIND assumes a single worker; with several,")
+            print("   reconnect replay can skip messages saved by another worker")
+        await write_behind.start()
+
+
+@app.on_event("shutdown")
+async def flush_write_behind():
+    """Flush (or spill to disk) any chat messages still buffered."""
+    if write_behind is not None:
+        await write_behind.stop()
 
 
 @app.on_event("startup")
@@ -73,10 +167,18 @@ async def initialize_chatbot_on_startup():
         )
         print("✅ FootyBot initialized successfully!")
         print("   Users can mention @FootyBot, !bot, or !footy in fan rooms")
+        if settings.BADWORDS_FILE:
+            chatbot_manager.start_badwords_watch(settings.BADWORDS_FILE)
     except Exception as e:
         print(f"❌ Failed to initialize FootyBot: {e}")
 
 
+@app.on_event("shutdown")
+def stop_badwords_watch():
+    """Stop reloading the moderation word list."""
+    chatbot_manager.stop_badwords_watch()
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -89,6 +191,79 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/rate-limits")
+async def rate_limit_stats():
+    """Chat flood-control counters for this worker."""
+    return chat_rate_limiter.stats()
+
+
+@app.get("/health/latency")
+async def latency_stats():
+    """Admission and message latency for this worker's websockets."""
+    return {
+        "fanrooms": {
+            "admission": fanroom_router.manager.admission_latency.as_dict(),
+            "message": fanroom_router.manager.message_latency.as_dict(),
+        },
+        "livegames": {
+            "admission": livegame_router.manager.admission_latency.as_dict(),
+            "message": livegame_router.manager.message_latency.as_dict(),
+        },
+        "admission_cache": admission_cache.stats(),
+        "footybot_answer_cache": chatbot_manager.answers.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "event_loop_lag": loop_monitor.lag.as_dict(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """This worker's realtime metrics in the Prometheus text format."""
+    metrics = MetricsWriter()
+    fanroom_router.manager.collect_metrics(metrics)
+    livegame_router.manager.collect_metrics(metrics)
+    for mode, latency in commit_latency.items():
+        metrics.histogram(
+            "footysocial_db_commit_latency_seconds",
+            "Time spent committing chat messages.",
+            latency.histogram,
+            {"mode": mode},
+        )
+    metrics.histogram(
+        "footysocial_event_loop_lag_seconds",
+        "How late the event loop ran a periodic timer.",
+        loop_monitor.lag.histogram,
+    )
+    metrics.gauge(
+        "footysocial_footybot_pending_replies",
+        "FootyBot replies being generated.",
+        sum(len(tasks) for tasks in fanroom_router.manager.bot_replies.values()),
+    )
+    for outcome, count in chatbot_manager.answers.counters.items():
+        metrics.counter("footysocial_footybot_answer_cache_lookups", "FootyBot answer cache lookups.", count, {"outcome": outcome})
+    metrics.gauge(
+        "footysocial_footybot_answer_cache_entries",
+        "FootyBot answers cached.",
+        len(chatbot_manager.answers.answers.entries),
+    )
+    llm_scheduler.collect_metrics(metrics)
+    if write_behind is not None:
+        metrics.gauge("footysocial_write_behind_pending", "Chat messages waiting to be flushed.", len(write_behind.pending))
+        for outcome, count in write_behind.counters.items():
+            metrics.counter("footysocial_write_behind_messages", "Buffered chat messages by outcome.", count, {"outcome": outcome})
+    for outcome, count in chat_rate_limiter.counters.items():
+        metrics.counter("footysocial_chat_frames", "Chat frames by rate-limit outcome.", count, {"outcome": outcome})
+    for outcome in ("hits", "misses"):
+        count = admission_cache.counters[outcome]
+        metrics.counter("footysocial_admission_cache_lookups", "Admission cache lookups.", count, {"outcome": outcome})
+    metrics.counter(
+        "footysocial_admission_cache_invalidations",
+        "Cached identities dropped after profile changes.",
+        admission_cache.counters["invalidations"],
+    )
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE)
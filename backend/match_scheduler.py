@@ -0,0 +1,198 @@
+"""
+Opens and closes live game rooms from the EPL fixture calendar.
+
+Each fixture gets two events on a heap keyed by time: open
+(``LIVE_GAME_OPEN_BEFORE_MINUTES`` before kickoff) creates the LiveGame row
+if it's missing and pre-warms caches, and close
+(``LIVE_GAME_CLOSE_AFTER_MINUTES`` after kickoff) marks the game closed and
+disconnects everyone. Fixtures are loaded ``LIVE_GAME_SCHEDULE_HORIZON_HOURS``
+ahead with an indexed range query, so each event costs a heap push/pop and
+one or two point queries.
+
+Every worker runs its own scheduler. The LiveGame row is keyed on the
+fixture's ID, so creating and closing are idempotent across workers and
+restarts; each worker closes its own sockets.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from admission import LiveGameInfo
+from config import settings
+from database import SessionLocal
+from models import EPLMatch, LiveGame
+
+logger = logging.getLogger(__name__)
+
+GameCallback = Callable[[LiveGameInfo], Awaitable[None]]
+
+OPEN = "open"
+CLOSE = "close"
+REFILL = "refill"
+
+
+class LiveGameScheduler:
+    """Timer heap of open/close events for upcoming fixtures."""
+
+    def __init__(
+        self,
+        on_open: GameCallback,
+        on_close: GameCallback,
+        session_factory=SessionLocal,
+        open_before: Optional[timedelta] = None,
+        close_after: Optional[timedelta] = None,
+        horizon: Optional[timedelta] = None,
+    ) -> None:
+        self.on_open = on_open
+        self.on_close = on_close
+        self.session_factory = session_factory
+        self.open_before = open_before or timedelta(minutes=settings.LIVE_GAME_OPEN_BEFORE_MINUTES)
+        self.close_after = close_after or timedelta(minutes=settings.LIVE_GAME_CLOSE_AFTER_MINUTES)
+        self.horizon = horizon or timedelta(hours=settings.LIVE_GAME_SCHEDULE_HORIZON_HOURS)
+        # (when, sequence, kind, match id); the sequence keeps ties in push order.
+        self.events: List[Tuple[datetime, int, str, int]] = []
+        self.scheduled: Set[Tuple[str, int]] = set()
+        # Fixtures kicking off before this have been loaded.
+        self.loaded_until: Optional[datetime] = None
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        now = datetime.utcnow()
+        for match_id in await asyncio.to_thread(self._overdue_matches, now):
+            self._push(now, CLOSE, match_id)
+        self._push(now, REFILL, 0)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, when: datetime, kind: str, match_id: int) -> None:
+        if (kind, match_id) in self.scheduled:
+            return
+        self.scheduled.add((kind, match_id))
+        heapq.heappush(self.events, (when, next(self._sequence), kind, match_id))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            while self.events and self.events[0][0] <= now:
+                _, _, kind, match_id = heapq.heappop(self.events)
+                self.scheduled.discard((kind, match_id))
+                try:
+                    await self._handle(kind, match_id, now)
+                except Exception:
+                    logger.exception("Live game %s event failed for match %s", kind, match_id)
+
+            self._wakeup.clear()
+            delay = (self.events[0][0] - now).total_seconds() if self.events else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handle(self, kind: str, match_id: int, now: datetime) -> None:
+        if kind == REFILL:
+            end = now + self.horizon
+            start = self.loaded_until or now - self.close_after
+            fixtures = await asyncio.to_thread(self._fixtures_between, start, end)
+            for fixture_id, match_date in fixtures:
+                self._push(max(now, match_date - self.open_before), OPEN, fixture_id)
+            self.loaded_until = end
+            # Top up again halfway through the window.
+            self._push(now + self.horizon / 2, REFILL, 0)
+            logger.debug("Scheduled %s fixtures up to %s", len(fixtures), end)
+            return
+
+        match = await asyncio.to_thread(self._load_match, match_id)
+        if match is None:
+            return
+        # The fixture may have been rescheduled since the event was pushed.
+        open_at = match.match_date - self.open_before
+        close_at = match.match_date + self.close_after
+
+        if kind == OPEN:
+            if now < open_at:
+                self._push(open_at, OPEN, match_id)
+            elif now < close_at:
+                game = await asyncio.to_thread(self._ensure_live_game, match)
+                logger.info("Opened live game %s for %s vs %s", game.id, game.home_team, game.away_team)
+                await self.on_open(game)
+                self._push(close_at, CLOSE, match_id)
+        elif kind == CLOSE:
+            if now < close_at:
+                self._push(close_at, CLOSE, match_id)
+                return
+            game = await asyncio.to_thread(self._mark_closed, match_id, now)
+            if game is not None:
+                logger.info("Closed live game %s for %s vs %s", game.id, game.home_team, game.away_team)
+                await self.on_close(game)
+
+    def _fixtures_between(self, start: datetime, end: datetime) -> List[Tuple[int, datetime]]:
+        with self.session_factory() as db:
+            return (
+                db.query(EPLMatch.id, EPLMatch.match_date)
+                .filter(EPLMatch.match_date >= start, EPLMatch.match_date < end)
+                .all()
+            )
+
+    def _overdue_matches(self, now: datetime) -> List[int]:
+        """Fixtures whose games a previous run left open past full time."""
+        with self.session_factory() as db:
+            rows = (
+                db.query(LiveGame.match_id)
+                .filter(
+                    LiveGame.match_id.isnot(None),
+                    LiveGame.closed_at.is_(None),
+                    LiveGame.match_date < now - self.close_after,
+                )
+                .all()
+            )
+        return [match_id for (match_id,) in rows]
+
+    def _load_match(self, match_id: int) -> Optional[EPLMatch]:
+        with self.session_factory() as db:
+            return db.get(EPLMatch, match_id)
+
+    def _ensure_live_game(self, match: EPLMatch) -> LiveGameInfo:
+        with self.session_factory() as db:
+            game = db.query(LiveGame).filter(LiveGame.match_id == match.id).first()
+            if game is None:
+                game = LiveGame(
+                    match_id=match.id,
+                    home_team=match.home_team,
+                    away_team=match.away_team,
+                    match_date=match.match_date,
+                )
+                db.add(game)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Another worker created it first.
+                    db.rollback()
+                    game = db.query(LiveGame).filter(LiveGame.match_id == match.id).one()
+            return _game_info(game)
+
+    def _mark_closed(self, match_id: int, now: datetime) -> Optional[LiveGameInfo]:
+        with self.session_factory() as db:
+            game = db.query(LiveGame).filter(LiveGame.match_id == match_id).first()
+            if game is None:
+                return None
+            if game.closed_at is None:
+                game.closed_at = now
+                db.commit()
+            return _game_info(game)
+
+
+def _game_info(game: LiveGame) -> LiveGameInfo:
+    return LiveGameInfo(game.id, game.home_team, game.away_team, game.match_date, game.closed_at)
@@ -0,0 +1,177 @@
+"""
+In-memory ring buffer of the most recent messages per fan room day and live game.
+
+Each buffer keeps the last ``MESSAGE_BUFFER_SIZE`` messages already encoded as
+JSON, so history requests that only want the tail are answered by joining
+cached strings instead of going to the database. Buffers are filled from the
+live broadcast path and lazily loaded from the database on a miss. When the
+total size passes ``MESSAGE_BUFFER_MEMORY_BYTES`` the least recently used
+rooms are evicted.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from broadcast import encode_frame
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead (tuple, str header, deque slot) on top of the JSON text.
+ENTRY_OVERHEAD_BYTES = 120
+
+
+class RoomBuffer:
+    """Recent encoded messages for one room, oldest first."""
+
+    __slots__ = ("entries", "complete", "loading", "pending", "size_bytes")
+
+    def __init__(self, capacity: int) -> None:
+        # Entries are (message_id, encoded JSON object).
+        self.entries: Deque[Tuple[int, str]] = deque(maxlen=capacity)
+        # True while the buffer holds the room's entire history.
+        self.complete = True
+        self.loading = False
+        # Messages that arrived while the database load was in flight.
+        self.pending: List[Tuple[int, str]] = []
+        self.size_bytes = 0
+
+
+class RecentMessageBuffer:
+    """Bounded per-room ring buffers with a global memory budget."""
+
+    def __init__(self, capacity: Optional[int] = None, memory_budget: Optional[int] = None) -> None:
+        self.capacity = capacity or settings.MESSAGE_BUFFER_SIZE
+        self.memory_budget = memory_budget or settings.MESSAGE_BUFFER_MEMORY_BYTES
+        self.rooms: "OrderedDict[Hashable, RoomBuffer]" = OrderedDict()
+        self.size_bytes = 0
+        # History endpoints run in the threadpool; the write path runs on the loop.
+        self._lock = threading.Lock()
+
+    def append(self, key: Hashable, message: Dict[str, Any]) -> None:
+        """Record a newly broadcast message. Ignored for rooms not yet buffered."""
+        with self._lock:
+            room = self.rooms.get(key)
+            if room is None:
+                return
+            entry = (message["message_id"], encode_frame(message))
+            if room.loading:
+                room.pending.append(entry)
+                return
+            self._push(room, entry)
+            self._evict_over_budget()
+
+    def tail(
+        self,
+        key: Hashable,
+        limit: int,
+        loader: Callable[[int], List[Dict[str, Any]]],
+        newest_first: bool = False,
+    ) -> Optional[str]:
+        """
+        Return the latest ``limit`` messages as a JSON array, or None if the
+        buffer can't answer (``limit`` larger than the buffer).
+
+        ``loader(n)`` must return the room's latest ``n`` messages, oldest
+        first; it is only called on a miss.
+        """
+        if limit > self.capacity:
+            return None
+        entries = self._entries_or_load(key, loader)
+        selected = entries[-limit:]
+        return self._to_json(selected, newest_first)
+
+    def since(
+        self,
+        key: Hashable,
+        message_id: int,
+        limit: int,
+        loader: Callable[[int], List[Dict[str, Any]]],
+        newest_first: bool = False,
+    ) -> Optional[str]:
+        """
+        Return up to ``limit`` messages after ``message_id``, oldest first, or
+        None if older messages have already rotated out of the buffer.
+        """
+        entries = self._entries_or_load(key, loader)
+        with self._lock:
+            room = self.rooms.get(key)
+            complete = room is not None and room.complete and not room.loading
+        if not complete and (not entries or entries[0][0] > message_id):
+            return None
+        selected = [entry for entry in entries if entry[0] > message_id][:limit]
+        return self._to_json(selected, newest_first)
+
+    def ensure_loaded(self, key: Hashable, loader: Callable[[int], List[Dict[str, Any]]]) -> None:
+        """Populate the room's buffer from ``loader`` if it isn't buffered yet."""
+        self._entries_or_load(key, loader)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            room = self.rooms.pop(key, None)
+            if room is not None:
+                self.size_bytes -= room.size_bytes
+
+    def _entries_or_load(self, key: Hashable, loader) -> List[Tuple[int, str]]:
+        with self._lock:
+            room = self.rooms.get(key)
+            if room is not None and not room.loading:
+                self.rooms.move_to_end(key)
+                return list(room.entries)
+            # Only the first miss populates the buffer; concurrent misses just read through.
+            owner = room is None
+            if owner:
+                room = RoomBuffer(self.capacity)
+                room.loading = True
+                self.rooms[key] = room
+
+        try:
+            messages = loader(self.capacity)
+        except Exception:
+            if owner:
+                self.discard(key)
+            raise
+        loaded = [(message["message_id"], encode_frame(message)) for message in messages]
+
+        with self._lock:
+            if not owner or self.rooms.get(key) is not room:
+                return loaded
+            for entry in loaded:
+                self._push(room, entry)
+            room.complete = len(loaded) < self.capacity
+            # Messages broadcast during the load may or may not be in the rows.
+            seen = {message_id for message_id, _ in loaded}
+            for entry in room.pending:
+                if entry[0] not in seen:
+                    self._push(room, entry)
+            room.pending = []
+            room.loading = False
+            self._evict_over_budget()
+            return list(room.entries)
+
+    def _push(self, room: RoomBuffer, entry: Tuple[int, str]) -> None:
+        if len(room.entries) == room.entries.maxlen:
+            dropped = room.entries[0]
+            room.size_bytes -= len(dropped[1]) + ENTRY_OVERHEAD_BYTES
+            self.size_bytes -= len(dropped[1]) + ENTRY_OVERHEAD_BYTES
+            room.complete = False
+        room.entries.append(entry)
+        room.size_bytes += len(entry[1]) + ENTRY_OVERHEAD_BYTES
+        self.size_bytes += len(entry[1]) + ENTRY_OVERHEAD_BYTES
+
+    def _evict_over_budget(self) -> None:
+        while self.size_bytes > self.memory_budget and len(self.rooms) > 1:
+            key, room = self.rooms.popitem(last=False)
+            self.size_bytes -= room.size_bytes
+            logger.debug("Evicted idle message buffer %s (%s bytes)", key, room.size_bytes)
+
+    @staticmethod
+    def _to_json(entries: List[Tuple[int, str]], newest_first: bool) -> str:
+        if newest_first:
+            entries = entries[::-1]
+        return "[" + ",".join(encoded for _, encoded in entries) + "]"
+
+
+recent_messages = RecentMessageBuffer()
@@ -0,0 +1,330 @@
+"""
+Persistence for fan room and live game chat messages.
+
+By default every message is committed inline, as before. With
+``MESSAGE_WRITE_BEHIND`` enabled, messages are given an ID from a block
+allocator, broadcast straight away, and bulk-inserted by a background flusher
+in batches. A message is never left unflushed for longer than
+``WRITE_BEHIND_MAX_LOSS_SECONDS``; anything still pending at shutdown is
+flushed, or spilled to disk and replayed on the next start if the database is
+unreachable.
+
+A batch the database rejects is retried row by row, so one bad row can't stall
+persistence: rows that still fail with an integrity or data error go to the
+dead-letter file (``WRITE_BEHIND_DEAD_LETTER_PATH``) instead of being retried.
+While the database is down, pending rows beyond ``WRITE_BEHIND_MAX_PENDING``
+are spilled to disk and replayed once flushes succeed again.
+
+Write-behind requires a single worker. Blocks are reserved atomically, so
+workers would never collide, but each hands out IDs from its own block: IDs
+would stop increasing in save order across workers, and reconnect replay
+(``id > last_message_id``) would skip messages saved by another worker. For
+the same reason it must not be mixed with inline autoincrement inserts.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import BINARY, Date, DateTime, case, func, insert, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import Base, SessionLocal
+from metrics import LatencyStats
+from models import FanRoomMessage, LiveGameMessage, MessageIdBlock
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_MODELS: Dict[str, Type[Base]] = {
+    FanRoomMessage.__tablename__: FanRoomMessage,
+    LiveGameMessage.__tablename__: LiveGameMessage,
+}
+
+# Time spent committing chat messages, per persistence mode.
+commit_latency: Dict[str, LatencyStats] = {"inline": LatencyStats(), "write_behind": LatencyStats()}
+
+
+class MessageIdAllocator:
+    """
+    Hi/lo ID allocator. Reserves blocks of IDs per table with one small
+    transaction, then hands them out from memory.
+    """
+
+    def __init__(self, session_factory=SessionLocal, block_size: Optional[int] = None) -> None:
+        self.session_factory = session_factory
+        self.block_size = block_size or settings.WRITE_BEHIND_ID_BLOCK_SIZE
+        # table name -> (next id, end of block exclusive)
+        self.blocks: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, model: Type[Base]) -> int:
+        table = model.__tablename__
+        with self._lock:
+            next_id, end = self.blocks.get(table, (0, 0))
+            if next_id >= end:
+                next_id, end = self._reserve_block(model)
+            self.blocks[table] = (next_id + 1, end)
+            return next_id
+
+    def _reserve_block(self, model: Type[Base]) -> Tuple[int, int]:
+        table = model.__tablename__
+        with self.session_factory() as db:
+            # Never hand out an ID at or below one already in the table.
+            floor = select(func.coalesce(func.max(model.id), 0) + 1).scalar_subquery()
+            # A single UPDATE moves the high-water mark, so two reservations
+            # can't read the same value (SELECT ... FOR UPDATE is a no-op on
+            # SQLite). The write lock it takes is held until the read-back
+            # below has committed.
+            bump = (
+                update(MessageIdBlock)
+                .where(MessageIdBlock.name == table)
+                .values(
+                    next_id=case((MessageIdBlock.next_id > floor, MessageIdBlock.next_id), else_=floor)
+                    + self.block_size
+                )
+            )
+            end = None
+            if db.execute(bump).rowcount == 0:
+                end = db.execute(select(floor)).scalar() + self.block_size
+                try:
+                    db.add(MessageIdBlock(name=table, next_id=end))
+                    db.commit()
+                except IntegrityError:
+                    # Another worker created the row first.
+                    db.rollback()
+                    db.execute(bump)
+                    end = None
+            if end is None:
+                end = db.query(MessageIdBlock.next_id).filter(MessageIdBlock.name == table).scalar()
+                db.commit()
+        start = end - self.block_size
+        logger.debug("Reserved %s IDs %s-%s", table, start, end - 1)
+        return start, end
+
+
+class WriteBehindWriter:
+    """Buffers message rows and bulk-inserts them from a background task."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: Optional[int] = None,
+        max_delay: Optional[float] = None,
+        spill_path: Optional[str] = None,
+        dead_letter_path: Optional[str] = None,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.WRITE_BEHIND_BATCH_SIZE
+        self.max_delay = max_delay or settings.WRITE_BEHIND_MAX_LOSS_SECONDS
+        self.spill_path = spill_path or settings.WRITE_BEHIND_SPILL_PATH
+        self.dead_letter_path = dead_letter_path or settings.WRITE_BEHIND_DEAD_LETTER_PATH
+        self.max_pending = max_pending or settings.WRITE_BEHIND_MAX_PENDING
+        self.pending: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self.counters: Dict[str, int] = {"written": 0, "dead_lettered": 0, "spilled": 0}
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+
+    def enqueue(self, model: Type[Base], row: Dict[str, Any]) -> None:
+        self.pending.append((model.__tablename__, row))
+        if len(self.pending) > self.max_pending:
+            # The database is falling behind or down; keep memory bounded.
+            self._spill(len(self.pending) - self.max_pending + self.batch_size)
+        if len(self.pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._replay_spill)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered. Called on application shutdown."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception:
+            logger.exception("Final write-behind flush failed; spilling %s messages", len(self.pending))
+            self._spill()
+
+    def flush(self) -> int:
+        """Insert every buffered row. Returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while self.pending:
+                written += self._write(self._take(self.batch_size))
+        self.counters["written"] += written
+        return written
+
+    def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+        try:
+            self._insert(batch)
+            return len(batch)
+        except Exception:
+            logger.warning("Write-behind batch of %s messages failed; retrying row by row", len(batch))
+
+        written = 0
+        for index, item in enumerate(batch):
+            try:
+                self._insert([item])
+            except (IntegrityError, DataError) as exc:
+                # The row itself is bad; retrying it would block every row behind it.
+                self._dead_letter(item, exc)
+            except Exception:
+                # The database is failing, not the row. Put the rest back in
+                # order so the next flush retries them.
+                self.pending.extendleft(reversed(batch[index:]))
+                raise
+            else:
+                written += 1
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                written = await asyncio.to_thread(self.flush)
+                if written:
+                    logger.debug("Write-behind flushed %s messages", written)
+            except Exception:
+                logger.exception("Write-behind flush failed; %s messages pending", len(self.pending))
+                continue
+            if len(self.pending) < self.max_pending // 2 and os.path.exists(self.spill_path):
+                # The database is back; pick up whatever overflowed to disk.
+                await asyncio.to_thread(self._replay_spill)
+
+    def _take(self, count: int) -> List[Tuple[str, Dict[str, Any]]]:
+        # Runs on the flush thread while _spill may pop the same deque from
+        # the event loop, so stop when it runs dry and keep what was taken.
+        batch = []
+        while len(batch) < count:
+            try:
+                batch.append(self.pending.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def _insert(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        rows_by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+
+        with self.session_factory() as db:
+            started = time.perf_counter()
+            for table, rows in rows_by_table.items():
+                db.execute(insert(MESSAGE_MODELS[table]), rows)
+            db.commit()
+            commit_latency["write_behind"].record(time.perf_counter() - started)
+
+    def _spill(self, count: Optional[int] = None) -> None:
+        """Move the oldest ``count`` pending rows (default all) to the spill file."""
+        spilled = 0
+        with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as spill:
+            while self.pending and (count is None or spilled < count):
+                try:
+                    table, row = self.pending.popleft()
+                except IndexError:
+                    # A concurrent flush took the last rows.
+                    break
+                spill.write(json.dumps({"table": table, "row": _encode_row(row)}) + "\n")
+                spilled += 1
+        if spilled:
+            self.counters["spilled"] += spilled
+            logger.warning("%s write-behind messages spilled to %s", spilled, self.spill_path)
+
+    def _replay_spill(self) -> None:
+        """Queue spilled rows for the flusher again and remove the spill file."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            rows = []
+            with open(self.spill_path, encoding="utf-8") as spill:
+                for line in spill:
+                    record = json.loads(line)
+                    model = MESSAGE_MODELS[record["table"]]
+                    rows.append((record["table"], _decode_row(model, record["row"])))
+            os.unlink(self.spill_path)
+        # Older than anything pending, so they go to the front. If the database
+        # fails again they spill again rather than being lost.
+        self.pending.extendleft(reversed(rows))
+        logger.info("Queued %s spilled write-behind messages for replay", len(rows))
+
+    def _dead_letter(self, item: Tuple[str, Dict[str, Any]], exc: Exception) -> None:
+        table, row = item
+        record = {"table": table, "row": _encode_row(row), "error": str(exc.orig if hasattr(exc, "orig") else exc)}
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter:
+            dead_letter.write(json.dumps(record) + "\n")
+        self.counters["dead_lettered"] += 1
+        logger.error("Write-behind message %s for %s dead-lettered: %s", row.get("id"), table, record["error"])
+
+
+def _encode_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    encoded = {}
+    for key, value in row.items():
+        if isinstance(value, bytes):
+            value = value.hex()
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        encoded[key] = value
+    return encoded
+
+
+def _decode_row(model: Type[Base], row: Dict[str, Any]) -> Dict[str, Any]:
+    columns = model.__table__.columns
+    decoded = {}
+    for key, value in row.items():
+        column_type = columns[key].type
+        if value is not None and isinstance(column_type, BINARY):
+            value = bytes.fromhex(value)
+        elif value is not None and isinstance(column_type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column_type, Date):
+            value = date.fromisoformat(value)
+        decoded[key] = value
+    return decoded
+
+
+id_allocator = MessageIdAllocator()
+write_behind = WriteBehindWriter() if settings.MESSAGE_WRITE_BEHIND else None
+
+
+async def save_message(db: Session, model: Type[Base], **fields: Any) -> int:
+    """
+    Persist a chat message and return its ID.
+
+    Inline mode commits on ``db`` straight away. Write-behind mode allocates
+    the ID up front and leaves the insert to the background flusher.
+    """
+    if write_behind is None:
+        message = model(**fields)
+        db.add(message)
+        started = time.perf_counter()
+        db.commit()
+        commit_latency["inline"].record(time.perf_counter() - started)
+        db.refresh(message)
+        return message.id
+
+    table = model.__tablename__
+    block_next, block_end = id_allocator.blocks.get(table, (0, 0))
+    if block_next >= block_end:
+        # Refill off the event loop; it's one short transaction per block.
+        message_id = await asyncio.to_thread(id_allocator.allocate, model)
+    else:
+        message_id = id_allocator.allocate(model)
+    write_behind.enqueue(model, {"id": message_id, **fields})
+    return message_id
@@ -0,0 +1,166 @@
+"""
+Realtime metrics in the Prometheus text format.
+
+Recording is a handful of plain attribute updates with no locks: the
+websocket managers all run on the event loop, and the odd increment lost to
+a worker thread racing it doesn't matter for monitoring. Collection walks
+the live objects only when ``/metrics`` is scraped.
+"""
+
+import asyncio
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Dict[str, Any]
+
+
+class Histogram:
+    """Fixed-bucket histogram; one bisect and three increments per observation."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        # The extra slot counts observations above the last bound.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class LatencyStats:
+    """Count, mean, max and histogram of a timed operation."""
+
+    __slots__ = ("count", "total_seconds", "max_seconds", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = Histogram()
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.histogram.observe(seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.total_seconds / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+class EventLoopMonitor:
+    """
+    Measures how long the event loop is blocked: a timer is scheduled every
+    ``LOOP_LAG_INTERVAL_SECONDS`` and the lateness of each wakeup is recorded.
+    """
+
+    def __init__(self, interval: Optional[float] = None) -> None:
+        self.interval = interval or settings.LOOP_LAG_INTERVAL_SECONDS
+        self.lag = LatencyStats()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(0.0, loop.time() - due))
+
+
+class MetricsWriter:
+    """Collects samples by metric family and renders the exposition text."""
+
+    def __init__(self) -> None:
+        # name -> (type, help, sample lines); families render in first-use order.
+        self.families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Labels] = None) -> None:
+        self._sample(name, "gauge", help_text, name, value, labels)
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Labels] = None) -> None:
+        """
+        Add a ``<name>_total`` sample. As prometheus_client does for text
+        format 0.0.4, the family's HELP and TYPE lines use that name too, so
+        they match the samples.
+        """
+        family = f"{name}_total"
+        self._sample(family, "counter", help_text, family, value, labels)
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, labels: Optional[Labels] = None) -> None:
+        labels = labels or {}
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            self._sample(name, "histogram", help_text, f"{name}_bucket", cumulative, {**labels, "le": bound})
+        self._sample(name, "histogram", help_text, f"{name}_bucket", histogram.count, {**labels, "le": "+Inf"})
+        self._sample(name, "histogram", help_text, f"{name}_sum", histogram.sum, labels)
+        self._sample(name, "histogram", help_text, f"{name}_count", histogram.count, labels)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def _sample(
+        self,
+        family: str,
+        kind: str,
+        help_text: str,
+        name: str,
+        value: float,
+        labels: Optional[Labels],
+    ) -> None:
+        if family not in self.families:
+            self.families[family] = (kind, help_text, [])
+        self.families[family][2].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+
+def _format_labels(labels: Optional[Labels]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+loop_monitor = EventLoopMonitor()
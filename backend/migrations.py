@@ -0,0 +1,64 @@
+"""
+Idempotent schema upgrades for databases created by an older version.
+
+``Base.metadata.create_all`` creates missing tables but never alters existing
+ones, so columns and indexes added to existing tables are applied here. Every
+step checks the live schema first, so this is safe to run on each start, on
+SQLite and MySQL alike.
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """Bring an existing database up to the current models."""
+    with engine.begin() as connection:
+        _add_live_game_fixture_columns(connection)
+        _create_missing_indexes(connection)
+
+
+def _add_live_game_fixture_columns(connection: Connection) -> None:
+    # live_games.match_id and closed_at, for rooms opened by the fixture scheduler.
+    inspector = inspect(connection)
+    columns = {column["name"] for column in inspector.get_columns("live_games")}
+    mysql = connection.dialect.name.startswith("mysql")
+
+    if "match_id" not in columns:
+        if mysql:
+            connection.execute(text("ALTER TABLE live_games ADD COLUMN match_id INT NULL"))
+            if inspector.has_table("epl_matches"):
+                connection.execute(text(
+                    "ALTER TABLE live_games ADD CONSTRAINT fk_live_games_match_id "
+                    "FOREIGN KEY (match_id) REFERENCES epl_matches (id) ON DELETE SET NULL"
+                ))
+        else:
+            connection.execute(text(
+                "ALTER TABLE live_games ADD COLUMN match_id INTEGER "
+                "REFERENCES epl_matches (id) ON DELETE SET NULL"
+            ))
+        # ADD COLUMN can't carry UNIQUE on SQLite; a unique index does the same job.
+        connection.execute(text("CREATE UNIQUE INDEX uq_live_games_match_id ON live_games (match_id)"))
+        logger.info("Added live_games.match_id")
+
+    if "closed_at" not in columns:
+        connection.execute(text("ALTER TABLE live_games ADD COLUMN closed_at DATETIME NULL"))
+        logger.info("Added live_games.closed_at")
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                logger.info("Created index %s", index.name)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Integer, DateTime, BINARY, Date, ForeignKey
+from sqlalchemy import Column, String, Text, Integer, DateTime, BINARY, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -60,6 +60,11 @@ class FanRoomMessage(Base):
     room = relationship("FanRoom", back_populates="messages")
     user = relationship("User")
 
+    __table_args__ = (
+        # Serves keyset pagination of a room's history for one day.
+        Index("ix_fan_room_messages_room_date_created_id", "room_id", "chat_date", "created_at", "id"),
+    )
+
 
 class EPLMatch(Base):
     __tablename__ = "epl_matches"
@@ -88,6 +93,9 @@ class LiveGame(Base):
     home_team = Column(String(100), nullable=False)
     away_team = Column(String(100), nullable=False)
     match_date = Column(DateTime, nullable=False, index=True)
+    # Set for games opened by the fixture scheduler.
+    match_id = Column(Integer, ForeignKey("epl_matches.id", ondelete="SET NULL"), unique=True, nullable=True)
+    closed_at = Column(DateTime, nullable=True)
 
     messages = relationship("LiveGameMessage", back_populates="game", cascade="all, delete-orphan")
 
@@ -103,3 +111,16 @@ class LiveGameMessage(Base):
 
     game = relationship("LiveGame", back_populates="messages")
     user = relationship("User")
+
+    __table_args__ = (
+        # Serves tail reads and since_id catch-up of a game's chat.
+        Index("ix_live_game_messages_game_id_id", "game_id", "id"),
+    )
+
+
+class MessageIdBlock(Base):
+    """High-water mark for the write-behind message ID allocator, one row per table."""
+    __tablename__ = "message_id_blocks"
+
+    name = Column(String(64), primary_key=True)
+    next_id = Column(Integer, nullable=False)
@@ -0,0 +1,128 @@
+"""
+Word-list matching for chat moderation.
+
+``WordMatcher`` is an Aho-Corasick automaton over word tokens rather than
+characters: every entry in the list is split into normalized tokens, and a
+message is scanned once, token by token, reporting every entry that occurs
+as a whole-word sequence. That keeps the ``\\b...\\b`` semantics of the old
+alternation regex, handles multi-word phrases, and costs one dict lookup per
+token however long the list is.
+
+Tokens are normalized before matching, the same way for the list and the
+message: case-folded, accents and compatibility forms folded to their base
+letters (``Ｓｈíｔ`` -> ``shit``), and common leetspeak substitutions undone
+in tokens that mix letters with digits or symbols (``sh1t``, ``a$$``). Plain
+numbers are left alone, so a scoreline or a ``455`` isn't read as a word.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Word characters plus the symbols leetspeak uses inside words.
+TOKEN_PATTERN = re.compile(r"[\w@$]+")
+
+LEETSPEAK = str.maketrans({
+    "0": "o",
+    "1": "i",
+    "3": "e",
+    "4": "a",
+    "5": "s",
+    "7": "t",
+    "@": "a",
+    "$": "s",
+})
+
+
+def undo_leetspeak(token: str) -> str:
+    """Undo leetspeak in a lower-cased token that has letters and non-letters."""
+    if token.isalpha() or not any(char.isalpha() for char in token):
+        return token
+    return token.translate(LEETSPEAK)
+
+
+def normalize_token(token: str) -> str:
+    """Fold a single token to the form the automaton matches on."""
+    if token.isascii():
+        token = token.lower()
+    else:
+        decomposed = unicodedata.normalize("NFKD", token)
+        token = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return undo_leetspeak(token)
+
+
+def tokenize(text: str) -> Iterator[Tuple[str, int, int]]:
+    """Yield ``(normalized token, start, end)`` with spans into the original text."""
+    for match in TOKEN_PATTERN.finditer(text):
+        yield normalize_token(match.group()), match.start(), match.end()
+
+
+class WordMatcher:
+    """Immutable token-level Aho-Corasick automaton over a word list."""
+
+    def __init__(self, words: Iterable[str]) -> None:
+        # State 0 is the root. goto[state] maps a token to the next state,
+        # output[state] holds (word, length in tokens) ending at that state.
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[str, int]]] = [[]]
+        self.words: List[str] = []
+
+        for word in words:
+            tokens = [token for token, _, _ in tokenize(word)]
+            if not tokens:
+                continue
+            self.words.append(word)
+            state = 0
+            for token in tokens:
+                next_state = self.goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][token] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append((word, len(tokens)))
+
+        self._link_failures()
+
+    def _link_failures(self) -> None:
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                # Inherit shorter matches ending here, so scanning never walks the chain.
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[str, int, int]]:
+        """Every listed word in the text as ``(word, start, end)``, in one pass."""
+        goto, fail, output = self.goto, self.fail, self.output
+        root = goto[0]
+        if text.isascii():
+            # Most chat is clean: reject it without building spans when no
+            # token could even start a listed word.
+            tokens = [undo_leetspeak(token) for token in TOKEN_PATTERN.findall(text.lower())]
+            if root.keys().isdisjoint(tokens):
+                return []
+        matches = []
+        starts: List[int] = []
+        state = 0
+        for token, start, end in tokenize(text):
+            starts.append(start)
+            if state == 0:
+                state = root.get(token, 0)
+            else:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            for word, length in output[state]:
+                matches.append((word, starts[-length], end))
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.words)
@@ -0,0 +1,120 @@
+"""
+Token-bucket flood control for the websocket receive loops.
+
+Every chat frame costs one token from the sender's bucket and one from the
+room's bucket. The user bucket stops a single client from spamming; the room
+bucket caps the aggregate rate a whole room can push at the database and the
+bot. Limits are per worker.
+"""
+
+import time
+from typing import Dict, Hashable, Optional
+
+from config import settings
+
+# Sweep idle buckets after this many checks so the tables don't grow forever.
+SWEEP_EVERY = 4096
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on each take."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens. Returns 0 on success, else seconds until they are available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / rate
+
+
+class RateLimiter:
+    """A table of token buckets sharing one rate and burst."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self._checks = 0
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        self._checks += 1
+        if self._checks % SWEEP_EVERY == 0:
+            self._sweep(now)
+        return bucket.take(self.rate, self.burst, now)
+
+    def refund(self, key: Hashable) -> None:
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + 1)
+
+    def _sweep(self, now: float) -> None:
+        # A bucket idle long enough to have refilled is the same as no bucket.
+        idle_after = self.burst / self.rate
+        for key, bucket in list(self.buckets.items()):
+            if now - bucket.updated >= idle_after:
+                del self.buckets[key]
+
+
+class ChatRateLimiter:
+    """Per-user and per-room chat limits with counters for monitoring."""
+
+    def __init__(self) -> None:
+        self.users = RateLimiter(settings.CHAT_USER_RATE, settings.CHAT_USER_BURST)
+        self.rooms = RateLimiter(settings.CHAT_ROOM_RATE, settings.CHAT_ROOM_BURST)
+        self.counters: Dict[str, int] = {"allowed": 0, "limited_user": 0, "limited_room": 0}
+
+    def check(self, user_key: Hashable, room_key: Hashable) -> Optional[dict]:
+        """Return None if the frame may proceed, else a ``rate_limited`` error frame."""
+        now = time.monotonic()
+
+        retry_after = self.users.take(user_key, now)
+        if retry_after:
+            self.counters["limited_user"] += 1
+            return rate_limited_frame("user", retry_after)
+
+        retry_after = self.rooms.take(room_key, now)
+        if retry_after:
+            # The frame is rejected, so don't charge the sender for it.
+            self.users.refund(user_key)
+            self.counters["limited_room"] += 1
+            return rate_limited_frame("room", retry_after)
+
+        self.counters["allowed"] += 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            "tracked_users": len(self.users.buckets),
+            "tracked_rooms": len(self.rooms.buckets),
+        }
+
+
+def rate_limited_frame(scope: str, retry_after: float) -> dict:
+    message = (
+        "You're sending messages too quickly. Please slow down."
+        if scope == "user"
+        else "This room is very busy right now. Please try again in a moment."
+    )
+    return {
+        "type": "error",
+        "code": "rate_limited",
+        "scope": scope,
+        "retry_after": round(retry_after, 2),
+        "message": message,
+    }
+
+
+chat_rate_limiter = ChatRateLimiter()
@@ -11,7 +11,8 @@ from auth import (
     get_password_hash,
     get_user_by_username,
     get_user_by_email,
-    get_current_active_user
+    get_current_active_user,
+    is_reserved_username
 )
 from config import settings
 from utils import user_to_response
@@ -22,7 +23,7 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 async def register(user: UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
     # Check if username already exists
-    if get_user_by_username(db, user.username):
+    if is_reserved_username(user.username) or get_user_by_username(db, user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
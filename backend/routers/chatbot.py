@@ -3,17 +3,33 @@ Chatbot functionality for fan room live chat.
 Integrates AI responses with OpenAI via LangChain and bad word filtering.
 """
 
+import asyncio
 import logging
+import os
 import re
+import time
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
 
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+from admission import TTLCache
+from config import settings
+from llm_scheduler import INTERACTIVE, LLMOverloaded, estimate_tokens, llm_scheduler
+from moderation import WordMatcher
+
 logger = logging.getLogger(__name__)
 
+# Recent messages formatted into the prompt.
+CONTEXT_LINES = 10
+# Rough per-message overhead (record, timestamp, deque slots) on top of the text.
+HISTORY_OVERHEAD_BYTES = 200
+
+FALLBACK_REPLY = "Sorry, I'm having trouble thinking right now. Try asking again! 🤔"
+
 
 class BadWordFilter:
     """Filters inappropriate content from chat messages."""
@@ -26,14 +42,8 @@ class BadWordFilter:
             badwords: List of words to filter. If None, uses default list.
             replacement: String to replace bad words with.
         """
-        self.badwords = badwords or self._default_badwords()
         self.replacement = replacement
-        
-        # Create case-insensitive regex pattern with word boundaries
-        self.pattern = re.compile(
-            r'\b(' + '|'.join(map(re.escape, self.badwords)) + r')\b',
-            re.IGNORECASE
-        )
+        self.reload(badwords or self._default_badwords())
     
     def _default_badwords(self) -> List[str]:
         """
@@ -47,6 +57,20 @@ class BadWordFilter:
             # Consider loading from a file for easier management
         ]
     
+    def reload(self, badwords: List[str]) -> None:
+        """
+        Replace the word list.
+        
+        The new automaton is built before it is swapped in, so messages
+        checked meanwhile use the old list rather than waiting.
+        
+        Args:
+            badwords: New list of words to filter
+        """
+        matcher = WordMatcher(badwords)
+        self.badwords = matcher.words
+        self.matcher = matcher
+    
     def contains_badwords(self, text: str) -> bool:
         """
         Check if text contains any bad words.
@@ -57,7 +81,7 @@ class BadWordFilter:
         Returns:
             True if bad words are found, False otherwise
         """
-        return bool(self.pattern.search(text))
+        return bool(self.matcher.find(text))
     
     def filter_text(self, text: str) -> str:
         """
@@ -69,7 +93,20 @@ class BadWordFilter:
         Returns:
             Filtered text with bad words replaced
         """
-        return self.pattern.sub(self.replacement, text)
+        spans = sorted((start, end) for _, start, end in self.matcher.find(text))
+        if not spans:
+            return text
+        
+        # Overlapping matches are replaced as one span.
+        parts, position = [], 0
+        for start, end in spans:
+            if start < position:
+                continue
+            parts.append(text[position:start])
+            parts.append(self.replacement)
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
     
     def get_violations(self, text: str) -> List[str]:
         """
@@ -79,15 +116,16 @@ class BadWordFilter:
             text: Text to check
             
         Returns:
-            List of bad words found
+            List of bad words found, as they appear in the word list
         """
-        matches = self.pattern.findall(text)
-        return list(set(matches)) if matches else []
+        return list({word: None for word, _, _ in self.matcher.find(text)})
 
 
 class ChatMessage:
     """Represents a message in the chat for bot context."""
     
+    __slots__ = ("username", "content", "timestamp", "is_bot")
+    
     def __init__(
         self,
         username: str,
@@ -104,6 +142,20 @@ class ChatMessage:
         return f"<ChatMessage {self.username}: {self.content[:30]}...>"
 
 
+class RoomHistory:
+    """Recent messages for one room, with their prompt lines formatted once."""
+    
+    __slots__ = ("messages", "lines", "context", "last_active", "size_bytes")
+    
+    def __init__(self, capacity: int):
+        self.messages: Deque[ChatMessage] = deque(maxlen=capacity)
+        self.lines: Deque[str] = deque(maxlen=min(capacity, CONTEXT_LINES))
+        # Joined lines, rebuilt only after a new message.
+        self.context: Optional[str] = None
+        self.last_active = time.monotonic()
+        self.size_bytes = 0
+
+
 class FootyBot:
     """
     AI-powered chatbot for soccer fan rooms.
@@ -117,7 +169,10 @@ class FootyBot:
         model: str = "gpt-4o-mini",
         temperature: float = 0.7,
         max_tokens: int = 300,
-        context_window: int = 15
+        context_window: int = 15,
+        timeout: Optional[float] = None,
+        history_idle_seconds: Optional[float] = None,
+        history_memory_bytes: Optional[int] = None
     ):
         """
         Initialize the soccer chatbot.
@@ -129,10 +184,16 @@ class FootyBot:
             temperature: Response creativity (0-1)
             max_tokens: Maximum response length
             context_window: Number of recent messages to consider
+            timeout: Seconds to wait for a reply before giving up
+            history_idle_seconds: Forget a room's history after this long without messages
+            history_memory_bytes: Total size of all rooms' history before the least
+                recently active rooms are forgotten
         """
         self.bot_name = bot_name
         self.model = model
+        self.max_tokens = max_tokens
         self.context_window = context_window
+        self.timeout = timeout or settings.FOOTYBOT_TIMEOUT_SECONDS
         
         # Initialize LangChain OpenAI
         self.llm = ChatOpenAI(
@@ -150,9 +211,17 @@ class FootyBot:
             "!footy",
             "hey bot",
         ]
+        self._mention_pattern = re.compile(
+            "|".join(re.escape(trigger.casefold()) for trigger in self.mention_triggers)
+        )
         
-        # Store recent messages per room for context
-        self.room_history: Dict[int, List[ChatMessage]] = {}
+        # Store recent messages per room for context, least recently active first
+        self.room_history: "OrderedDict[int, RoomHistory]" = OrderedDict()
+        self.history_idle_seconds = (
+            settings.FOOTYBOT_HISTORY_IDLE_SECONDS if history_idle_seconds is None else history_idle_seconds
+        )
+        self.history_memory_bytes = history_memory_bytes or settings.FOOTYBOT_HISTORY_MEMORY_BYTES
+        self.history_bytes = 0
         
         # System prompt defines bot personality
         self.system_prompt = self._create_system_prompt()
@@ -211,6 +280,23 @@ class FootyBot:
         content_lower = content.lower()
         return any(trigger.lower() in content_lower for trigger in self.mention_triggers)
     
+    def question_key(self, content: str) -> str:
+        """
+        Normalize a question for the answer cache.
+        
+        Mentions are stripped and case, whitespace and surrounding
+        punctuation folded, so "@FootyBot who scored?" and "!bot  Who
+        scored" share an entry.
+        
+        Args:
+            content: Message content
+            
+        Returns:
+            Normalized question text
+        """
+        question = self._mention_pattern.sub(" ", content.casefold())
+        return " ".join(question.split()).strip(" ?!.,:;")
+    
     def add_message_to_history(self, room_id: int, message: ChatMessage) -> None:
         """
         Add a message to room history for context.
@@ -219,14 +305,43 @@ class FootyBot:
             room_id: Room ID
             message: ChatMessage to add
         """
-        if room_id not in self.room_history:
-            self.room_history[room_id] = []
-        
-        self.room_history[room_id].append(message)
-        
-        # Keep only recent messages
-        if len(self.room_history[room_id]) > self.context_window:
-            self.room_history[room_id] = self.room_history[room_id][-self.context_window:]
+        now = time.monotonic()
+        history = self.room_history.get(room_id)
+        if history is None:
+            history = self.room_history[room_id] = RoomHistory(self.context_window)
+        else:
+            self.room_history.move_to_end(room_id)
+        history.last_active = now
+        
+        # Full deques drop their oldest entry on append
+        if len(history.messages) == history.messages.maxlen:
+            self._resize(history, -self._message_size(history.messages[0]))
+        history.messages.append(message)
+        history.lines.append(f"[{message.timestamp.strftime('%H:%M')}] {message.username}: {message.content}")
+        history.context = None
+        self._resize(history, self._message_size(message))
+        
+        self._evict_history(now)
+    
+    @staticmethod
+    def _message_size(message: ChatMessage) -> int:
+        # The formatted prompt line repeats the username and content.
+        return 2 * (len(message.username) + len(message.content)) + HISTORY_OVERHEAD_BYTES
+    
+    def _resize(self, history: RoomHistory, delta: int) -> None:
+        history.size_bytes += delta
+        self.history_bytes += delta
+    
+    def _evict_history(self, now: float) -> None:
+        """Forget idle rooms, then the least recently active ones while over the memory cap."""
+        while self.room_history:
+            room_id, history = next(iter(self.room_history.items()))
+            idle = self.history_idle_seconds and now - history.last_active >= self.history_idle_seconds
+            if not idle and (self.history_bytes <= self.history_memory_bytes or len(self.room_history) == 1):
+                break
+            self.room_history.popitem(last=False)
+            self.history_bytes -= history.size_bytes
+            logger.debug(f"Evicted bot history for room {room_id} ({history.size_bytes} bytes)")
     
     def _get_room_context(self, room_id: int) -> str:
         """
@@ -238,36 +353,42 @@ class FootyBot:
         Returns:
             Formatted context string
         """
-        messages = self.room_history.get(room_id, [])
+        history = self.room_history.get(room_id)
         
-        if not messages:
+        if history is None or not history.lines:
             return "No recent chat history."
         
-        context_lines = []
-        for msg in messages[-10:]:  # Last 10 messages
-            time_str = msg.timestamp.strftime("%H:%M")
-            context_lines.append(f"[{time_str}] {msg.username}: {msg.content}")
+        # Lines are formatted as messages arrive; only the join is redone, and
+        # only when something was said since the last mention.
+        if history.context is None:
+            history.context = "\n".join(history.lines)
         
-        return "\n".join(context_lines)
+        return history.context
     
     async def generate_response(
         self,
         room_id: int,
         user_message: str,
-        username: str,
+        username: Optional[str],
         team_name: Optional[str] = None
-    ) -> str:
+    ) -> Optional[str]:
         """
         Generate AI response to user message.
         
+        The LLM call is awaited with ``ainvoke`` so the event loop keeps
+        serving every other socket while the reply is generated. It goes
+        through the shared LLM scheduler at interactive priority; time spent
+        queued counts towards the timeout.
+        
         Args:
             room_id: Fan room ID
             user_message: The message content
-            username: Username who sent the message
+            username: Username who sent the message, or None to leave the
+                asker unnamed (for answers shared between fans)
             team_name: Name of the team's fan room (optional)
             
         Returns:
-            Bot's response text
+            Bot's response text, or None if it timed out or was shed
         """
         try:
             # Remove mention triggers from the actual question
@@ -284,21 +405,38 @@ class FootyBot:
             prompt = f"""Recent chat context:
 {context}
 
-{username} just asked you: {question}{team_context}
+{username or "A fan"} just asked you: {question}{team_context}
 
 Respond to their question. Remember: 1-3 sentences max, be helpful and engaging!"""
             
             # Get response from OpenAI via LangChain
-            response = self.chain.invoke({
-                "input": prompt,
-                "history": []  # We include context in the prompt instead
-            })
+            response = await asyncio.wait_for(
+                llm_scheduler.run(
+                    self.chain,
+                    {
+                        "input": prompt,
+                        "history": []  # We include context in the prompt instead
+                    },
+                    priority=INTERACTIVE,
+                    room=room_id,
+                    tokens=estimate_tokens(self.system_prompt, prompt, max_tokens=self.max_tokens)
+                ),
+                timeout=self.timeout
+            )
             
             return response.content.strip()
             
+        except LLMOverloaded as e:
+            # Too many questions queued; skip this one rather than answer late.
+            logger.warning(f"Bot response shed in room {room_id}: {e}")
+            return None
+        except asyncio.TimeoutError:
+            # The chat has moved on; a late answer would only confuse it.
+            logger.warning(f"Bot response timed out after {self.timeout}s in room {room_id}")
+            return None
         except Exception as e:
             logger.error(f"Error generating bot response: {e}")
-            return "Sorry, I'm having trouble thinking right now. Try asking again! 🤔"
+            return FALLBACK_REPLY
     
     def clear_room_history(self, room_id: int) -> None:
         """
@@ -307,8 +445,9 @@ Respond to their question. Remember: 1-3 sentences max, be helpful and engaging!
         Args:
             room_id: Room ID to clear
         """
-        if room_id in self.room_history:
-            self.room_history[room_id] = []
+        history = self.room_history.pop(room_id, None)
+        if history is not None:
+            self.history_bytes -= history.size_bytes
             logger.info(f"Cleared history for room {room_id}")
     
     def set_team_context(self, room_id: int, home_team: str, away_team: str) -> None:
@@ -325,6 +464,90 @@ Respond to their question. Remember: 1-3 sentences max, be helpful and engaging!
         logger.info(f"Match context set for room {room_id}: {home_team} vs {away_team}")
 
 
+class AnswerCache:
+    """
+    Recent FootyBot answers with TTL and LRU eviction.
+    
+    Generation is single-flight: a question asked again while its answer is
+    still being generated waits for that call instead of starting another.
+    """
+    
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None):
+        """
+        Args:
+            ttl: Seconds an answer is reused (0 disables caching)
+            max_size: Most answers kept
+        """
+        self.ttl = settings.FOOTYBOT_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.answers = TTLCache(self.ttl, max_size or settings.FOOTYBOT_CACHE_SIZE)
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        # Askers still awaiting each in-flight generation.
+        self.waiters: Dict[asyncio.Task, int] = {}
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "shared": 0}
+    
+    async def get_or_generate(
+        self,
+        key: Hashable,
+        generate: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        """
+        Return the cached answer for key, generating it at most once.
+        
+        Args:
+            key: Normalized question and room context
+            generate: Produces the answer on a miss
+            
+        Returns:
+            The answer, or None if generation gave up
+        """
+        if self.ttl <= 0:
+            return await generate()
+        
+        answer = self.answers.get(key)
+        if answer is not None:
+            self.counters["hits"] += 1
+            return answer
+        
+        task = self.in_flight.get(key)
+        if task is None:
+            self.counters["misses"] += 1
+            task = asyncio.create_task(self._generate(key, generate))
+            self.in_flight[key] = task
+        else:
+            self.counters["shared"] += 1
+        
+        # Shielded so one asker going away doesn't cancel the answer others
+        # are waiting for; the last one to go cancels it, freeing its LLM slot.
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.waiters[task] == 1 and not task.done():
+                task.cancel()
+                # A new asker must start afresh, not join the cancelled call.
+                if self.in_flight.get(key) is task:
+                    del self.in_flight[key]
+            raise
+        finally:
+            self.waiters[task] -= 1
+            if not self.waiters[task]:
+                del self.waiters[task]
+    
+    async def _generate(self, key: Hashable, generate: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        try:
+            answer = await generate()
+            # Timeouts and errors are retried by the next asker, not cached.
+            if answer is not None and answer != FALLBACK_REPLY:
+                self.answers.set(key, answer)
+            return answer
+        finally:
+            if self.in_flight.get(key) is asyncio.current_task():
+                del self.in_flight[key]
+    
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "cached_answers": len(self.answers.entries), "in_flight": len(self.in_flight)}
+
+
 class ChatbotManager:
     """
     Manages bot instances and filtering for the entire application.
@@ -345,6 +568,8 @@ class ChatbotManager:
         
         self.bot: Optional[FootyBot] = None
         self.filter: Optional[BadWordFilter] = None
+        self.answers = AnswerCache()
+        self._badwords_watch: Optional[asyncio.Task] = None
         self._initialized = True
     
     def initialize(
@@ -376,6 +601,50 @@ class ChatbotManager:
             logger.error(f"Failed to initialize chatbot: {e}")
             raise
     
+    async def reload_badwords(self, badwords: List[str]) -> None:
+        """
+        Swap in a new bad word list without stalling chat.
+        
+        Args:
+            badwords: New list of words to filter
+        """
+        if not self.filter:
+            return
+        # A list of thousands of terms takes a moment to build; do it off the event loop.
+        await asyncio.to_thread(self.filter.reload, badwords)
+        logger.info(f"Bad word list reloaded ({len(self.filter.badwords)} entries)")
+    
+    def start_badwords_watch(self, path: str, interval: Optional[float] = None) -> None:
+        """
+        Load the bad word list from a file and reload it whenever the file changes.
+        
+        Args:
+            path: File with one word or phrase per line
+            interval: Seconds between checks for changes
+        """
+        self.stop_badwords_watch()
+        self._badwords_watch = asyncio.create_task(
+            self._watch_badwords_file(path, interval or settings.BADWORDS_RELOAD_SECONDS)
+        )
+    
+    def stop_badwords_watch(self) -> None:
+        """Stop watching the bad word file."""
+        if self._badwords_watch is not None:
+            self._badwords_watch.cancel()
+            self._badwords_watch = None
+    
+    async def _watch_badwords_file(self, path: str, interval: float) -> None:
+        last_modified = None
+        while True:
+            try:
+                modified = os.path.getmtime(path)
+                if modified != last_modified:
+                    await self.reload_badwords(await asyncio.to_thread(load_badwords_file, path))
+                    last_modified = modified
+            except OSError as e:
+                logger.error(f"Could not read bad word file {path}: {e}")
+            await asyncio.sleep(interval)
+    
     def is_initialized(self) -> bool:
         """Check if bot and filter are initialized."""
         return self.bot is not None and self.filter is not None
@@ -395,57 +664,81 @@ class ChatbotManager:
         if not self.filter:
             return True, None
         
-        if self.filter.contains_badwords(content):
-            violations = self.filter.get_violations(content)
+        # One scan finds every violation.
+        violations = self.filter.get_violations(content)
+        if violations:
             logger.warning(f"Bad words detected: {violations}")
             return False, "Your message contains inappropriate language and cannot be sent."
         
         return True, None
     
-    async def process_message(
+    def observe_message(
         self,
         room_id: int,
         username: str,
         content: str,
-        timestamp: datetime,
-        team_name: Optional[str] = None
-    ) -> Optional[str]:
+        timestamp: datetime
+    ) -> bool:
         """
-        Process a chat message and generate bot response if mentioned.
+        Add a chat message to the bot's context.
         
         Args:
             room_id: Fan room ID
             username: Username who sent the message
             content: Message content
             timestamp: Message timestamp
-            team_name: Team name for the room (optional)
             
         Returns:
-            Bot response if bot was mentioned, None otherwise
+            True if the message mentions the bot and wants a reply
         """
         if not self.bot:
-            return None
+            return False
         
-        # Add message to bot's context
-        message = ChatMessage(
-            username=username,
-            content=content,
-            timestamp=timestamp,
-            is_bot=False
+        self.bot.add_message_to_history(
+            room_id,
+            ChatMessage(username=username, content=content, timestamp=timestamp, is_bot=False)
         )
-        self.bot.add_message_to_history(room_id, message)
+        return self.bot.is_mentioned(content)
+    
+    async def reply(
+        self,
+        room_id: int,
+        username: str,
+        content: str,
+        team_name: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Generate the bot's reply to a message that mentioned it.
         
-        # Check if bot should respond
-        if not self.bot.is_mentioned(content):
+        Answers are cached per room and normalized question, so a burst of
+        fans asking the same thing costs one LLM call. A shared answer is
+        written without naming the fan who happened to ask first.
+        
+        Args:
+            room_id: Fan room ID
+            username: Username who sent the message
+            content: Message content
+            team_name: Team name for the room (optional)
+            
+        Returns:
+            Bot response, or None if there isn't one
+        """
+        if not self.bot:
             return None
         
-        # Generate response
-        response = await self.bot.generate_response(
-            room_id=room_id,
-            user_message=content,
-            username=username,
-            team_name=team_name
+        bot = self.bot
+        key = (room_id, team_name, bot.question_key(content))
+        response = await self.answers.get_or_generate(
+            key,
+            lambda: bot.generate_response(
+                room_id=room_id,
+                user_message=content,
+                username=None if self.answers.ttl > 0 else username,
+                team_name=team_name
+            )
         )
+        if response is None:
+            return None
         
         # Add bot's response to context too
         bot_message = ChatMessage(
@@ -457,6 +750,39 @@ class ChatbotManager:
         self.bot.add_message_to_history(room_id, bot_message)
         
         return response
+    
+    async def process_message(
+        self,
+        room_id: int,
+        username: str,
+        content: str,
+        timestamp: datetime,
+        team_name: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Process a chat message and generate bot response if mentioned.
+        
+        Args:
+            room_id: Fan room ID
+            username: Username who sent the message
+            content: Message content
+            timestamp: Message timestamp
+            team_name: Team name for the room (optional)
+            
+        Returns:
+            Bot response if bot was mentioned, None otherwise
+        """
+        if not self.observe_message(room_id, username, content, timestamp):
+            return None
+        
+        return await self.reply(room_id, username, content, team_name)
+
+
+def load_badwords_file(path: str) -> List[str]:
+    """Read a bad word list: one word or phrase per line, # starts a comment."""
+    with open(path, encoding="utf-8") as badwords_file:
+        lines = (line.split("#", 1)[0].strip() for line in badwords_file)
+        return [line for line in lines if line]
 
 
 # Global singleton instance
@@ -1,24 +1,40 @@
+import asyncio
+import json
 import logging
+import secrets
+import time
+import uuid
 from collections import defaultdict
-from datetime import datetime, date
-from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
+from typing import Coroutine, Dict, List, Optional, Set, Tuple, Union
 
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 
-from auth import get_user_by_username, verify_token
-from routers.chatbot import check_message_content, process_chat_message
+from admission import FanRoomInfo, Identity, admission_cache
+from archive import chat_archive
+from auth import get_password_hash
+from backplane import backplane
+from broadcast import BroadcastEngine, RoomDebouncer, negotiate_frame_format, receive_payload
+from config import settings
+from routers.chatbot import chatbot_manager, check_message_content
 from database import SessionLocal, get_db
+from message_buffer import recent_messages
+from message_store import save_message
+from metrics import LatencyStats, MetricsWriter
 from models import FanRoom, FanRoomMessage, User
+from ratelimit import chat_rate_limiter
 from schemas import FanRoomMessageResponse, FanRoomResponse
-from utils import uuid_bytes_to_str
+from utils import UuidStrCache, json_response, parse_message_id, uuid_bytes_to_str
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +70,21 @@ TEAM_NAME_ALIASES = {
     "wolverhampton": "Wolverhampton Wanderers",
 }
 
+# Backplane channel shared by every worker's fan room manager.
+BACKPLANE_CHANNEL = "fanrooms"
+
+# Fields of a chat_message frame that make up a history entry, in response order.
+HISTORY_FIELDS = ("message_id", "room_id", "user_id", "username", "content", "created_at", "chat_date")
+
+# FootyBot's replies are stored under its own account, so history shows them
+# as FootyBot whether it is served from the buffer, the database or the archive.
+BOT_USER_ID = uuid.UUID("5f00b07e-b07e-4b07-8b07-f00b07f00b07").bytes
+BOT_USERNAME = "FootyBot"
+BOT_EMAIL = "footybot@footysocial.invalid"
+# Cleared at startup if a human account already holds BOT_USERNAME or BOT_EMAIL; replies
+# are then broadcast but not stored, since there's no account to store them under.
+bot_replies_persisted = True
+
 router = APIRouter(prefix="/fanrooms", tags=["fanrooms"])
 
 
@@ -84,7 +115,37 @@ def ensure_fan_rooms_exist(db: Session) -> None:
         db.commit()
 
 
-def is_global_room(room: FanRoom) -> bool:
+def ensure_bot_user_exists(db: Session) -> None:
+    """Create FootyBot's account if it is missing. Nobody can log in as it."""
+    global bot_replies_persisted
+    existing = (
+        db.query(User.user_id)
+        .filter((User.user_id == BOT_USER_ID) | (User.username == BOT_USERNAME) | (User.email == BOT_EMAIL))
+        .all()
+    )
+    if any(row.user_id == BOT_USER_ID for row in existing):
+        return
+    if existing:
+        # Both are reserved now, but an account made before that may hold them.
+        logger.error(
+            "FootyBot's username or email belongs to a user account; its replies won't be saved to history"
+        )
+        bot_replies_persisted = False
+        return
+    db.add(
+        User(
+            user_id=BOT_USER_ID,
+            first_name="Footy",
+            last_name="Bot",
+            username=BOT_USERNAME,
+            email=BOT_EMAIL,
+            password_hash=get_password_hash(secrets.token_urlsafe(32)),
+        )
+    )
+    db.commit()
+
+
+def is_global_room(room: Union[FanRoom, FanRoomInfo]) -> bool:
     return room.team_name.strip().lower() == GLOBAL_FAN_ROOM_NAME.lower()
 
 
@@ -92,44 +153,151 @@ class FanRoomConnectionManager:
     """Manage websocket connections for fan rooms."""
 
     def __init__(self) -> None:
-        self.active_connections: Dict[int, Dict[WebSocket, User]] = defaultdict(dict)
-
-    async def connect(self, room_id: int, websocket: WebSocket, user: User) -> None:
-        await websocket.accept()
+        self.active_connections: Dict[int, Dict[WebSocket, Identity]] = defaultdict(dict)
+        self.engine = BroadcastEngine(on_connection_lost=self._drop_connection)
+        # Connect-to-welcome and receive-to-broadcast times.
+        self.admission_latency = LatencyStats()
+        self.message_latency = LatencyStats()
+        # Presence changes are coalesced per room: one outbound count and one
+        # frame to local sockets per interval, however many joins and leaves.
+        self.presence_updates = RoomDebouncer(settings.PRESENCE_INTERVAL_SECONDS, self.broadcast_presence)
+        self.presence_frames = RoomDebouncer(settings.PRESENCE_INTERVAL_SECONDS, self._send_presence_frame)
+        # FootyBot replies still being generated, per room.
+        self.bot_replies: Dict[int, Set[asyncio.Task]] = defaultdict(set)
+        backplane.subscribe(BACKPLANE_CHANNEL, self._on_backplane_message, self.get_local_counts)
+
+    async def connect(self, room_id: int, websocket: WebSocket, user: Identity) -> None:
+        frame_format, subprotocol = negotiate_frame_format(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         self.active_connections[room_id][websocket] = user
+        self.engine.register(room_id, websocket, frame_format)
 
     def disconnect(self, room_id: int, websocket: WebSocket) -> None:
+        self.engine.unregister(room_id, websocket)
         room_connections = self.active_connections.get(room_id)
         if not room_connections:
             return
         room_connections.pop(websocket, None)
         if not room_connections:
             self.active_connections.pop(room_id, None)
+            if not self.get_active_count(room_id):
+                # Nobody is left to read FootyBot's answers.
+                self.cancel_bot_replies(room_id)
 
-    def get_active_count(self, room_id: int) -> int:
+    def get_local_count(self, room_id: int) -> int:
         return len(self.active_connections.get(room_id, {}))
 
-    def get_participants(self, room_id: int) -> List[User]:
+    def get_local_counts(self) -> Dict[int, int]:
+        return {room_id: len(connections) for room_id, connections in self.active_connections.items()}
+
+    def get_active_count(self, room_id: int) -> int:
+        """Connections in the room across every worker."""
+        return self.get_local_count(room_id) + backplane.remote_count(BACKPLANE_CHANNEL, room_id)
+
+    def get_participants(self, room_id: int) -> List[Identity]:
         return list(self.active_connections.get(room_id, {}).values())
 
+    def get_fanout_stats(self, room_id: int) -> dict:
+        return self.engine.get_fanout_stats(room_id)
+
+    def collect_metrics(self, metrics: MetricsWriter) -> None:
+        labels = {"manager": "fanrooms"}
+        self.engine.collect_metrics(metrics, labels, lambda room_id: {"room": room_id})
+        metrics.histogram(
+            "footysocial_ws_admission_latency_seconds",
+            "Time from websocket connect to the welcome frame.",
+            self.admission_latency.histogram,
+            labels,
+        )
+        metrics.histogram(
+            "footysocial_ws_message_latency_seconds",
+            "Time from receiving a chat frame to broadcasting it.",
+            self.message_latency.histogram,
+            labels,
+        )
+
+    def touch(self, room_id: int, websocket: WebSocket) -> None:
+        """Record a sign of life from the socket for the heartbeat reaper."""
+        self.engine.touch(room_id, websocket)
+
+    async def send_personal(self, room_id: int, websocket: WebSocket, payload: dict) -> None:
+        self.engine.send_to(room_id, websocket, payload)
+
+    async def replay_missed(self, room_id: int, websocket: WebSocket, last_message_id: int) -> None:
+        """Send a reconnecting socket today's messages after ``last_message_id``."""
+        def load() -> Tuple[List[dict], bool]:
+            with SessionLocal() as db:
+                return _missed_fan_room_messages(db, room_id, last_message_id)
+
+        await self.engine.replay(room_id, websocket, load)
+
     async def broadcast(self, room_id: int, payload: dict) -> None:
-        for connection in list(self.active_connections.get(room_id, {})):
-            try:
-                await connection.send_json(payload)
-            except Exception:
-                # Connection is already closed; drop it.
-                self.disconnect(room_id, connection)
+        await backplane.publish(BACKPLANE_CHANNEL, {"kind": "frame", "room_id": room_id, "payload": payload})
+
+    def spawn_bot_reply(self, room_id: int, reply: Coroutine) -> None:
+        """Run a FootyBot reply in the background, tied to the room's lifetime."""
+        task = asyncio.create_task(reply)
+        self.bot_replies[room_id].add(task)
+        task.add_done_callback(lambda done: self._bot_reply_done(room_id, done))
+
+    def cancel_bot_replies(self, room_id: int) -> None:
+        for task in self.bot_replies.pop(room_id, ()):
+            task.cancel()
+
+    def schedule_presence(self, room_id: int) -> None:
+        """Note a join or leave; the presence update goes out on the room's next tick."""
+        self.presence_updates.request(room_id)
 
     async def broadcast_presence(self, room_id: int) -> None:
-        await self.broadcast(
+        await backplane.publish(
+            BACKPLANE_CHANNEL,
+            {"kind": "presence", "room_id": room_id, "count": self.get_local_count(room_id)},
+        )
+
+    def _on_backplane_message(self, message: dict) -> None:
+        room_id = message["room_id"]
+        kind = message.get("kind")
+        if kind == "frame":
+            payload = message["payload"]
+            self.engine.publish(room_id, payload)
+            if payload.get("type") == "chat_message" and payload.get("message_id") is not None:
+                # Unsaved bot replies have no id and aren't part of history.
+                recent_messages.append(
+                    fan_room_buffer_key(room_id, payload["chat_date"]),
+                    {field: payload[field] for field in HISTORY_FIELDS},
+                )
+        elif kind == "presence":
+            self.presence_frames.request(room_id)
+
+    def _send_presence_frame(self, room_id: int) -> None:
+        if not self.get_local_count(room_id):
+            return
+        self.engine.publish(
             room_id,
             {
                 "type": "presence",
                 "room_id": room_id,
                 "active_users": self.get_active_count(room_id),
             },
+            coalesce_key="presence",
         )
 
+    def _bot_reply_done(self, room_id: int, task: asyncio.Task) -> None:
+        tasks = self.bot_replies.get(room_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self.bot_replies[room_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("FootyBot reply failed in room %s", room_id, exc_info=task.exception())
+
+    def _drop_connection(self, room_id: int, websocket: WebSocket) -> None:
+        # A writer failed or was cut off as a slow consumer.
+        was_connected = websocket in self.active_connections.get(room_id, {})
+        self.disconnect(room_id, websocket)
+        if was_connected:
+            self.schedule_presence(room_id)
+
 
 manager = FanRoomConnectionManager()
 
@@ -187,43 +355,265 @@ def get_fan_room(room_id: int, db: Session = Depends(get_db)) -> FanRoomResponse
 def get_fan_room_messages(
     room_id: int,
     chat_date: Optional[date] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    order: str = "asc",
     db: Session = Depends(get_db),
-) -> List[FanRoomMessageResponse]:
+) -> Response:
+    """
+    Page through a room's messages for one day using keyset cursors.
+
+    Without a cursor the latest ``limit`` messages are returned. ``before_id``
+    pages back from a message, ``after_id`` pages forward (``after_id=0``
+    starts from the beginning of the day). ``order`` is ``asc`` (oldest first)
+    or ``desc`` (newest first).
+    """
+    if limit <= 0 or limit > 500:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Limit must be between 1 and 500")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order must be 'asc' or 'desc'")
+
+    target_date = chat_date or date.today()
+
+    if before_id is None and after_id is None and target_date == date.today():
+        # Today's tail is served from the recent-message buffer.
+        cached = recent_messages.tail(
+            fan_room_buffer_key(room_id, target_date.isoformat()),
+            limit,
+            loader=lambda count: _latest_fan_room_messages(db, room_id, target_date, count),
+            newest_first=order == "desc",
+        )
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
+
+    if target_date != date.today():
+        archived = chat_archive.fan_room_day(room_id, target_date)
+        if archived is not None:
+            return json_response(_page_archived_messages(archived, before_id, after_id, limit, order))
+
     room = db.query(FanRoom).filter(FanRoom.id == room_id).first()
     if room is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fan room not found")
 
-    target_date = chat_date or date.today()
+    sort_key = tuple_(FanRoomMessage.created_at, FanRoomMessage.id)
+
+    query = fan_room_history_query(db).filter(
+        FanRoomMessage.room_id == room_id,
+        FanRoomMessage.chat_date == target_date,
+    )
+    if before_id is not None:
+        query = query.filter(sort_key < _message_cursor(db, room_id, before_id))
+    if after_id:
+        query = query.filter(sort_key > _message_cursor(db, room_id, after_id))
+
+    # Scan from whichever end the cursor points at; the tail by default.
+    scan_forward = after_id is not None and before_id is None
+    if scan_forward:
+        query = query.order_by(FanRoomMessage.created_at.asc(), FanRoomMessage.id.asc())
+    else:
+        query = query.order_by(FanRoomMessage.created_at.desc(), FanRoomMessage.id.desc())
+    rows = query.limit(limit).all()
+
+    if scan_forward != (order == "asc"):
+        rows.reverse()
+
+    return json_response(fan_room_rows_to_dicts(room_id, rows))
+
+
+def fan_room_buffer_key(room_id: int, chat_date: str) -> tuple:
+    return ("fanroom", room_id, chat_date)
 
-    messages = (
-        db.query(FanRoomMessage)
-        .filter(
-            FanRoomMessage.room_id == room_id,
-            FanRoomMessage.chat_date == target_date,
+
+def _latest_fan_room_messages(db: Session, room_id: int, chat_date: date, count: int) -> List[dict]:
+    """Buffer loader: the day's latest ``count`` messages, oldest first."""
+    if db.query(FanRoom.id).filter(FanRoom.id == room_id).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fan room not found")
+    rows = (
+        fan_room_history_query(db)
+        .filter(FanRoomMessage.room_id == room_id, FanRoomMessage.chat_date == chat_date)
+        .order_by(FanRoomMessage.created_at.desc(), FanRoomMessage.id.desc())
+        .limit(count)
+        .all()
+    )
+    rows.reverse()
+    return fan_room_rows_to_dicts(room_id, rows)
+
+
+def fan_room_history_query(db: Session):
+    """Message columns joined to the author's username, without ORM hydration."""
+    return db.query(
+        FanRoomMessage.id,
+        FanRoomMessage.user_id,
+        User.username,
+        FanRoomMessage.content,
+        FanRoomMessage.created_at,
+        FanRoomMessage.chat_date,
+    ).outerjoin(User, User.user_id == FanRoomMessage.user_id)
+
+
+def fan_room_rows_to_dicts(room_id: int, rows) -> List[dict]:
+    """Shape rows from fan_room_history_query like FanRoomMessageResponse."""
+    user_ids = UuidStrCache()
+    return [
+        {
+            "message_id": message_id,
+            "room_id": room_id,
+            "user_id": user_ids[user_id],
+            "username": username or "Unknown",
+            "content": content,
+            "created_at": created_at.isoformat(),
+            "chat_date": chat_date.isoformat(),
+        }
+        for message_id, user_id, username, content, created_at, chat_date in rows
+    ]
+
+
+def _missed_fan_room_messages(db: Session, room_id: int, last_message_id: int) -> Tuple[List[dict], bool]:
+    """
+    Today's messages after ``last_message_id``, oldest first, for a reconnecting
+    socket. Returns at most ``RECONNECT_REPLAY_LIMIT`` and whether that was all.
+    """
+    limit = settings.RECONNECT_REPLAY_LIMIT
+    today = date.today()
+    cached = recent_messages.since(
+        fan_room_buffer_key(room_id, today.isoformat()),
+        last_message_id,
+        limit + 1,
+        loader=lambda count: _latest_fan_room_messages(db, room_id, today, count),
+    )
+    if cached is not None:
+        messages = json.loads(cached)
+    else:
+        rows = (
+            fan_room_history_query(db)
+            .filter(
+                FanRoomMessage.room_id == room_id,
+                FanRoomMessage.chat_date == today,
+                FanRoomMessage.id > last_message_id,
+            )
+            .order_by(FanRoomMessage.id.asc())
+            .limit(limit + 1)
+            .all()
         )
-        .order_by(FanRoomMessage.created_at.asc())
+        messages = fan_room_rows_to_dicts(room_id, rows)
+    return messages[:limit], len(messages) <= limit
+
+
+def _page_archived_messages(
+    messages: List[dict],
+    before_id: Optional[int],
+    after_id: Optional[int],
+    limit: int,
+    order: str,
+) -> List[dict]:
+    """Apply the endpoint's cursor semantics to an archived day, already in (created_at, id) order."""
+    positions = {message["message_id"]: index for index, message in enumerate(messages)}
+
+    def cursor(message_id: int) -> int:
+        if message_id not in positions:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown message cursor")
+        return positions[message_id]
+
+    start, end = 0, len(messages)
+    if before_id is not None:
+        end = cursor(before_id)
+    if after_id:
+        start = cursor(after_id) + 1
+    window = messages[start:end]
+
+    scan_forward = after_id is not None and before_id is None
+    page = window[:limit] if scan_forward else window[-limit:]
+    return page[::-1] if order == "desc" else page
+
+
+def archive_fan_room_days(db: Session, now: datetime) -> int:
+    """Archive task: move room days past the retention window to cold storage."""
+    cutoff = now.date() - timedelta(days=settings.ARCHIVE_FAN_ROOM_RETENTION_DAYS)
+    room_days = (
+        db.query(FanRoomMessage.room_id, FanRoomMessage.chat_date)
+        .filter(FanRoomMessage.chat_date < cutoff)
+        .distinct()
         .all()
     )
 
-    response_messages: List[FanRoomMessageResponse] = []
-    for message in messages:
-        response_messages.append(
-            FanRoomMessageResponse(
-                message_id=message.id,
-                room_id=message.room_id,
-                user_id=uuid_bytes_to_str(message.user_id) or "",
-                username=message.user.username if message.user else "Unknown",
-                content=message.content,
-                created_at=message.created_at,
-                chat_date=message.chat_date,
-            )
+    archived = 0
+    for room_id, chat_date in room_days:
+        in_day = (FanRoomMessage.room_id == room_id, FanRoomMessage.chat_date == chat_date)
+        rows = (
+            fan_room_history_query(db)
+            .filter(*in_day)
+            .order_by(FanRoomMessage.created_at.asc(), FanRoomMessage.id.asc())
+            .all()
+        )
+        messages = fan_room_rows_to_dicts(room_id, rows)
+        chat_archive.write(
+            chat_archive.fan_room_day_path(room_id, chat_date),
+            messages,
+            sort_key=lambda message: (message["created_at"], message["message_id"]),
         )
+        db.query(FanRoomMessage).filter(*in_day).delete(synchronize_session=False)
+        db.commit()
+        recent_messages.discard(fan_room_buffer_key(room_id, chat_date.isoformat()))
+        archived += len(messages)
+    return archived
+
+
+def _message_cursor(db: Session, room_id: int, message_id: int) -> tuple:
+    """Resolve a message ID cursor to its (created_at, id) sort key."""
+    created_at = (
+        db.query(FanRoomMessage.created_at)
+        .filter(FanRoomMessage.id == message_id, FanRoomMessage.room_id == room_id)
+        .scalar()
+    )
+    if created_at is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown message cursor")
+    return tuple_(created_at, message_id)
 
-    return response_messages
+
+async def post_bot_reply(room_id: int, user: Identity, content: str, asked_at: datetime, team_name: str) -> None:
+    """Generate FootyBot's answer to a mention and post it to the room."""
+    bot_response = await chatbot_manager.reply(room_id, user.username, content, team_name)
+    if not bot_response:
+        return
+
+    logger.info("FootyBot responding in room %s to user %s", room_id, user.username)
+
+    # Save bot message to database
+    bot_created_at = datetime.utcnow()
+    bot_message_id = None
+    if bot_replies_persisted:
+        with SessionLocal() as db:
+            bot_message_id = await save_message(
+                db,
+                FanRoomMessage,
+                room_id=room_id,
+                user_id=BOT_USER_ID,
+                content=bot_response,
+                created_at=bot_created_at,
+                chat_date=asked_at.date(),
+            )
+
+    # Broadcast bot response
+    await manager.broadcast(
+        room_id,
+        {
+            "type": "chat_message",
+            "message_id": bot_message_id,
+            "room_id": room_id,
+            "user_id": uuid_bytes_to_str(BOT_USER_ID),
+            "username": BOT_USERNAME,
+            "content": bot_response,
+            "created_at": bot_created_at.isoformat(),
+            "chat_date": asked_at.date().isoformat(),
+            "is_bot": True,  # Flag so frontend can style differently
+        },
+    )
 
 
 @router.websocket("/ws/{room_id}")
 async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
+    started = time.perf_counter()
     logger.info("WebSocket connection attempt for room_id=%s from client %s", room_id, websocket.client)
     token = websocket.query_params.get("token")
     if not token:
@@ -231,22 +621,17 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
         await websocket.close(code=1008, reason="Authentication required")
         return
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-    )
-
-    try:
-        token_data = verify_token(token, credentials_exception)
-    except HTTPException:
+    username = admission_cache.username_for_token(token)
+    if username is None:
         logger.warning("WebSocket denied for room_id=%s: invalid token", room_id)
         await websocket.close(code=1008, reason="Authentication failed")
         return
 
     db = SessionLocal()
+    connected = False
     try:
-        user = get_user_by_username(db, token_data.username)
-        room = db.query(FanRoom).filter(FanRoom.id == room_id).first()
+        user = admission_cache.identity_for(db, username)
+        room = admission_cache.fan_room(db, room_id)
 
         if room is None or user is None:
             logger.warning(
@@ -260,7 +645,7 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
 
         if not is_global_room(room):
             if not user.favorite_team:
-                logger.warning("WebSocket denied for room_id=%s user=%s: favorite team missing", room_id, token_data.username)
+                logger.warning("WebSocket denied for room_id=%s user=%s: favorite team missing", room_id, username)
                 await websocket.close(code=1008, reason="Set your favorite team to join a fan room")
                 return
 
@@ -268,7 +653,7 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
                 logger.warning(
                     "WebSocket denied for room_id=%s user=%s: favorite team mismatch (%s vs %s)",
                     room_id,
-                    token_data.username,
+                    username,
                     user.favorite_team,
                     room.team_name,
                 )
@@ -276,8 +661,11 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
                 return
 
         await manager.connect(room_id, websocket, user)
-        logger.info("WebSocket connected for room_id=%s user=%s", room_id, token_data.username)
-        await websocket.send_json(
+        connected = True
+        logger.info("WebSocket connected for room_id=%s user=%s", room_id, username)
+        await manager.send_personal(
+            room_id,
+            websocket,
             {
                 "type": "welcome",
                 "room_id": room_id,
@@ -285,15 +673,36 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
                 "active_users": manager.get_active_count(room_id),
             }
         )
-        await manager.broadcast_presence(room_id)
+        manager.schedule_presence(room_id)
+
+        last_message_id = parse_message_id(websocket.query_params.get("last_message_id"))
+        if last_message_id is not None:
+            await manager.replay_missed(room_id, websocket, last_message_id)
+
+        manager.admission_latency.record(time.perf_counter() - started)
+        # Admission is done; don't pin a session and its identity map to the socket.
+        db.close()
 
         while True:
-            payload = await websocket.receive_json()
-            content = (payload or {}).get("content", "").strip()
+            payload = await receive_payload(
+                websocket, lambda frame: manager.send_personal(room_id, websocket, frame)
+            )
+            received = time.perf_counter()
+            manager.touch(room_id, websocket)
+            if payload.get("type") == "pong":
+                continue
+
+            rate_limited = chat_rate_limiter.check(user.user_id, ("fanroom", room_id))
+            if rate_limited:
+                await manager.send_personal(room_id, websocket, rate_limited)
+                continue
+
+            content = payload.get("content")
+            content = content.strip() if isinstance(content, str) else ""
 
             if not content:
-                await websocket.send_json(
-                    {"type": "error", "message": "Message cannot be empty."}
+                await manager.send_personal(
+                    room_id, websocket, {"type": "error", "message": "Message cannot be empty."}
                 )
                 continue
 
@@ -305,85 +714,48 @@ async def fan_room_websocket(websocket: WebSocket, room_id: int) -> None:
                     user.username,
                     room_id
                 )
-                await websocket.send_json(
-                    {"type": "error", "message": error_msg}
+                await manager.send_personal(
+                    room_id, websocket, {"type": "error", "message": error_msg}
                 )
                 continue
 
             # Save and broadcast user message
             now = datetime.utcnow()
-            message = FanRoomMessage(
-                room_id=room_id,
-                user_id=user.user_id,
-                content=content,
-                created_at=now,
-                chat_date=now.date(),
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
+            with SessionLocal() as db:
+                message_id = await save_message(
+                    db,
+                    FanRoomMessage,
+                    room_id=room_id,
+                    user_id=user.user_id,
+                    content=content,
+                    created_at=now,
+                    chat_date=now.date(),
+                )
 
             await manager.broadcast(
                 room_id,
                 {
                     "type": "chat_message",
-                    "message_id": message.id,
+                    "message_id": message_id,
                     "room_id": room_id,
-                    "user_id": uuid_bytes_to_str(message.user_id) or "",
+                    "user_id": uuid_bytes_to_str(user.user_id) or "",
                     "username": user.username,
-                    "content": message.content,
-                    "created_at": message.created_at.isoformat(),
-                    "chat_date": message.chat_date.isoformat(),
+                    "content": content,
+                    "created_at": now.isoformat(),
+                    "chat_date": now.date().isoformat(),
                 },
             )
+            manager.message_latency.record(time.perf_counter() - received)
 
-            # Check if FootyBot should respond
-            bot_response = await process_chat_message(
-                room_id=room_id,
-                username=user.username,
-                content=content,
-                timestamp=now,
-                team_name=room.team_name
-            )
-
-            if bot_response:
-                logger.info(
-                    "FootyBot responding in room %s to user %s",
-                    room_id,
-                    user.username
-                )
-                
-                # Save bot message to database
-                bot_message = FanRoomMessage(
-                    room_id=room_id,
-                    user_id=user.user_id,  # You might want to create a special bot user instead
-                    content=bot_response,
-                    created_at=datetime.utcnow(),
-                    chat_date=now.date(),
-                )
-                db.add(bot_message)
-                db.commit()
-                db.refresh(bot_message)
-
-                # Broadcast bot response
-                await manager.broadcast(
-                    room_id,
-                    {
-                        "type": "chat_message",
-                        "message_id": bot_message.id,
-                        "room_id": room_id,
-                        "user_id": "bot",
-                        "username": "FootyBot",
-                        "content": bot_response,
-                        "created_at": bot_message.created_at.isoformat(),
-                        "chat_date": bot_message.chat_date.isoformat(),
-                        "is_bot": True,  # Flag so frontend can style differently
-                    },
-                )
+            # FootyBot answers on a background task so this socket keeps reading.
+            if chatbot_manager.observe_message(room_id, user.username, content, now):
+                manager.spawn_bot_reply(room_id, post_bot_reply(room_id, user, content, now, room.team_name))
 
     except WebSocketDisconnect:
-        manager.disconnect(room_id, websocket)
-        await manager.broadcast_presence(room_id)
         logger.info("WebSocket disconnected for room_id=%s", room_id)
     finally:
+        # Whatever ended the loop, don't leave the socket registered.
+        if connected:
+            manager.disconnect(room_id, websocket)
+            manager.schedule_presence(room_id)
         db.close()
\ No newline at end of file
@@ -1,41 +1,98 @@
+import asyncio
+import json
 import logging
+import math
+import time
 from collections import defaultdict
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, Optional, Set, Tuple
 
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
 from sqlalchemy.orm import Session
 
-from auth import get_user_by_username, verify_token
+from admission import Identity, LiveGameInfo, admission_cache
+from archive import chat_archive
+from backplane import backplane
+from broadcast import BroadcastEngine, RoomDebouncer, negotiate_frame_format, receive_payload
+from config import settings
 from database import SessionLocal, get_db
+from match_scheduler import LiveGameScheduler
+from message_buffer import recent_messages
+from message_store import save_message
+from metrics import LatencyStats, MetricsWriter
 from models import LiveGame, LiveGameMessage, User
+from ratelimit import RateLimiter, chat_rate_limiter
 from routers.chatbot import check_message_content
 from schemas import LiveGameMessageResponse, LiveGameResponse
-from utils import uuid_bytes_to_str
+from utils import UuidStrCache, json_response, parse_message_id, uuid_bytes_to_str
 
 logger = logging.getLogger(__name__)
 
+# Backplane channel shared by every worker's live game manager.
+BACKPLANE_CHANNEL = "livegames"
+
+# Fields of a chat_message frame that make up a history entry, in response order.
+HISTORY_FIELDS = ("message_id", "game_id", "user_id", "username", "content", "created_at")
+
 router = APIRouter(prefix="/livegames", tags=["livegames"])
 
 
 class LiveGameConnectionManager:
-    """Manage websocket connections for live game rooms."""
+    """
+    Manage websocket connections for live game rooms.
+
+    With ``LIVE_GAME_SHARDING`` on, a game is split into shards of about
+    ``LIVE_GAME_SHARD_SIZE`` connections. New connections join the least
+    loaded shard, and the shard count grows with the game's presence. A
+    shard gets every message sent from it plus a sampled feed of the other
+    shards' chat, at most ``LIVE_GAME_CROSS_SHARD_RATE`` messages a second.
+    Shards span workers: shard 2 on one worker also gets shard 2's messages
+    from the others.
+    """
 
     def __init__(self) -> None:
-        self.active_connections: Dict[int, Dict[WebSocket, User]] = defaultdict(dict)
-
-    async def connect(self, game_id: int, websocket: WebSocket, user: User) -> None:
-        await websocket.accept()
+        self.active_connections: Dict[int, Dict[WebSocket, Identity]] = defaultdict(dict)
+        self.engine = BroadcastEngine(on_connection_lost=self._drop_connection)
+        self.shard_size = settings.LIVE_GAME_SHARD_SIZE if settings.LIVE_GAME_SHARDING else 0
+        # game_id -> local connections per shard, and each connection's shard.
+        self.shards: Dict[int, List[Set[WebSocket]]] = defaultdict(list)
+        self.shard_of: Dict[WebSocket, int] = {}
+        self.cross_shard = RateLimiter(settings.LIVE_GAME_CROSS_SHARD_RATE, settings.LIVE_GAME_CROSS_SHARD_BURST)
+        # Connect-to-welcome and receive-to-broadcast times.
+        self.admission_latency = LatencyStats()
+        self.message_latency = LatencyStats()
+        # Presence changes are coalesced per room: one outbound count and one
+        # frame to local sockets per interval, however many joins and leaves.
+        self.presence_updates = RoomDebouncer(settings.PRESENCE_INTERVAL_SECONDS, self.broadcast_presence)
+        self.presence_frames = RoomDebouncer(settings.PRESENCE_INTERVAL_SECONDS, self._send_presence_frame)
+        backplane.subscribe(BACKPLANE_CHANNEL, self._on_backplane_message, self.get_local_counts)
+
+    async def connect(self, game_id: int, websocket: WebSocket, user: Identity) -> None:
+        frame_format, subprotocol = negotiate_frame_format(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        shard = self._assign_shard(game_id, websocket) if self.shard_size else 0
         self.active_connections[game_id][websocket] = user
+        self.engine.register(self._room_key(game_id, shard), websocket, frame_format)
 
     def disconnect(self, game_id: int, websocket: WebSocket) -> None:
+        shard = self.shard_of.pop(websocket, 0)
+        self.engine.unregister(self._room_key(game_id, shard), websocket)
+        if self.shard_size and game_id in self.shards:
+            game_shards = self.shards[game_id]
+            if shard < len(game_shards):
+                game_shards[shard].discard(websocket)
+            while game_shards and not game_shards[-1]:
+                game_shards.pop()
+            if not game_shards:
+                del self.shards[game_id]
         room_connections = self.active_connections.get(game_id)
         if not room_connections:
             return
@@ -43,26 +100,176 @@ class LiveGameConnectionManager:
         if not room_connections:
             self.active_connections.pop(game_id, None)
 
-    def get_active_count(self, game_id: int) -> int:
+    def get_local_count(self, game_id: int) -> int:
         return len(self.active_connections.get(game_id, {}))
 
-    async def broadcast(self, game_id: int, payload: dict) -> None:
-        for connection in list(self.active_connections.get(game_id, {})):
-            try:
-                await connection.send_json(payload)
-            except Exception:
-                self.disconnect(game_id, connection)
+    def get_local_counts(self) -> Dict[int, int]:
+        return {game_id: len(connections) for game_id, connections in self.active_connections.items()}
+
+    def get_active_count(self, game_id: int) -> int:
+        """Connections in the room across every worker."""
+        return self.get_local_count(game_id) + backplane.remote_count(BACKPLANE_CHANNEL, game_id)
+
+    def get_shard(self, websocket: WebSocket) -> int:
+        return self.shard_of.get(websocket, 0)
+
+    def get_fanout_stats(self, game_id: int) -> dict:
+        """Fan-out figures for the game; sharded games also break them down under ``shards``."""
+        keys = [(game_id, shard) for shard in range(len(self.shards.get(game_id, [])))] if self.shard_size else []
+        if not keys:
+            return self.engine.get_fanout_stats(game_id)
+        return {
+            **self.engine.get_fanout_stats(*keys),
+            "shards": {shard: self.engine.get_fanout_stats(key) for shard, key in enumerate(keys)},
+        }
+
+    def collect_metrics(self, metrics: MetricsWriter) -> None:
+        labels = {"manager": "livegames"}
+        self.engine.collect_metrics(metrics, labels, self._room_labels)
+        metrics.histogram(
+            "footysocial_ws_admission_latency_seconds",
+            "Time from websocket connect to the welcome frame.",
+            self.admission_latency.histogram,
+            labels,
+        )
+        metrics.histogram(
+            "footysocial_ws_message_latency_seconds",
+            "Time from receiving a chat frame to broadcasting it.",
+            self.message_latency.histogram,
+            labels,
+        )
+
+    def touch(self, game_id: int, websocket: WebSocket) -> None:
+        """Record a sign of life from the socket for the heartbeat reaper."""
+        self.engine.touch(self._room_key(game_id, self.get_shard(websocket)), websocket)
+
+    async def send_personal(self, game_id: int, websocket: WebSocket, payload: dict) -> None:
+        self.engine.send_to(self._room_key(game_id, self.get_shard(websocket)), websocket, payload)
+
+    async def replay_missed(self, game_id: int, websocket: WebSocket, last_message_id: int) -> None:
+        """Send a reconnecting socket the game's messages after ``last_message_id``."""
+        def load() -> Tuple[List[dict], bool]:
+            with SessionLocal() as db:
+                return _missed_live_game_messages(db, game_id, last_message_id)
+
+        await self.engine.replay(self._room_key(game_id, self.get_shard(websocket)), websocket, load)
+
+    async def broadcast(self, game_id: int, payload: dict, origin: Optional[WebSocket] = None) -> None:
+        """Send to the game on every worker; ``origin`` pins chat to the sender's shard."""
+        message = {"kind": "frame", "room_id": game_id, "payload": payload}
+        if self.shard_size and origin is not None:
+            message["shard"] = self.get_shard(origin)
+        await backplane.publish(BACKPLANE_CHANNEL, message)
+
+    def schedule_presence(self, game_id: int) -> None:
+        """Note a join or leave; the presence update goes out on the room's next tick."""
+        self.presence_updates.request(game_id)
 
     async def broadcast_presence(self, game_id: int) -> None:
-        await self.broadcast(
-            game_id,
-            {"type": "presence", "game_id": game_id, "active_users": self.get_active_count(game_id)},
+        await backplane.publish(
+            BACKPLANE_CHANNEL,
+            {"kind": "presence", "room_id": game_id, "count": self.get_local_count(game_id)},
         )
 
+    def _room_key(self, game_id: int, shard: int) -> Hashable:
+        return (game_id, shard) if self.shard_size else game_id
+
+    def _room_labels(self, room_key: Hashable) -> Dict[str, int]:
+        if isinstance(room_key, tuple):
+            return {"room": room_key[0], "shard": room_key[1]}
+        return {"room": room_key}
+
+    def _assign_shard(self, game_id: int, websocket: WebSocket) -> int:
+        game_shards = self.shards[game_id]
+        wanted = max(1, math.ceil((self.get_active_count(game_id) + 1) / self.shard_size))
+        while len(game_shards) < wanted:
+            game_shards.append(set())
+        shard = min(range(wanted), key=lambda index: len(game_shards[index]))
+        game_shards[shard].add(websocket)
+        self.shard_of[websocket] = shard
+        return shard
+
+    def _on_backplane_message(self, message: dict) -> None:
+        game_id = message["room_id"]
+        kind = message.get("kind")
+        if kind == "frame":
+            payload = message["payload"]
+            if self.shard_size:
+                self._publish_to_shards(game_id, payload, message.get("shard"))
+            else:
+                self.engine.publish(game_id, payload)
+            if payload.get("type") == "chat_message":
+                recent_messages.append(
+                    live_game_buffer_key(game_id),
+                    {field: payload[field] for field in HISTORY_FIELDS},
+                )
+        elif kind == "presence":
+            self.presence_frames.request(game_id)
+
+    def _publish_to_shards(self, game_id: int, payload: dict, origin: Optional[int], **kwargs) -> None:
+        cross_shard_payload = None
+        for shard in range(len(self.shards.get(game_id, []))):
+            if origin is None or shard == origin:
+                self.engine.publish((game_id, shard), payload, **kwargs)
+            elif payload.get("type") == "chat_message" and not self.cross_shard.take((game_id, shard)):
+                # Other shards' chat is sampled down to a readable rate.
+                if cross_shard_payload is None:
+                    cross_shard_payload = {**payload, "shard": origin, "cross_shard": True}
+                self.engine.publish((game_id, shard), cross_shard_payload, **kwargs)
+
+    def _send_presence_frame(self, game_id: int) -> None:
+        if not self.get_local_count(game_id):
+            return
+        payload = {"type": "presence", "game_id": game_id, "active_users": self.get_active_count(game_id)}
+        if self.shard_size:
+            self._publish_to_shards(game_id, payload, None, coalesce_key="presence")
+        else:
+            self.engine.publish(game_id, payload, coalesce_key="presence")
+
+    def _drop_connection(self, room_key: Hashable, websocket: WebSocket) -> None:
+        game_id = room_key[0] if isinstance(room_key, tuple) else room_key
+        was_connected = websocket in self.active_connections.get(game_id, {})
+        self.disconnect(game_id, websocket)
+        if was_connected:
+            self.schedule_presence(game_id)
+
+    async def close_room(self, game_id: int, code: int = 1000, reason: str = "") -> None:
+        """Disconnect every local connection to the game."""
+        for websocket in list(self.active_connections.get(game_id, {})):
+            self.disconnect(game_id, websocket)
+            try:
+                await websocket.close(code=code, reason=reason)
+            except Exception:
+                pass
+
 
 manager = LiveGameConnectionManager()
 
 
+async def open_live_game(game: LiveGameInfo) -> None:
+    """Scheduler hook: warm the admission cache and history buffer before kickoff."""
+    admission_cache.live_games.set(game.id, game)
+
+    def load_buffer() -> None:
+        with SessionLocal() as db:
+            recent_messages.ensure_loaded(
+                live_game_buffer_key(game.id),
+                lambda count: _latest_live_game_messages(db, game.id, count),
+            )
+
+    await asyncio.to_thread(load_buffer)
+
+
+async def close_live_game(game: LiveGameInfo) -> None:
+    """Scheduler hook: disconnect everyone after full time and drop the hot state."""
+    admission_cache.live_games.pop(game.id)
+    await manager.close_room(game.id, reason="Full time")
+    recent_messages.discard(live_game_buffer_key(game.id))
+
+
+scheduler = LiveGameScheduler(on_open=open_live_game, on_close=close_live_game)
+
+
 @router.get("", response_model=List[LiveGameResponse])
 def list_live_games(db: Session = Depends(get_db)) -> List[LiveGameResponse]:
     games = db.query(LiveGame).order_by(LiveGame.match_date.asc()).all()
@@ -94,67 +301,224 @@ def get_live_game(game_id: int, db: Session = Depends(get_db)) -> LiveGameRespon
 @router.get("/{game_id}/messages", response_model=List[LiveGameMessageResponse])
 def get_live_game_messages(
     game_id: int,
+    since_id: Optional[int] = None,
+    before_id: Optional[int] = None,
     limit: int = 100,
+    order: str = "asc",
     db: Session = Depends(get_db),
-) -> List[LiveGameMessageResponse]:
+) -> Response:
+    """
+    Read a game's chat from the tail.
+
+    Without a cursor the latest ``limit`` messages are returned. ``since_id``
+    returns messages newer than the one the client last saw (oldest first,
+    so a client that gets a full page asks again from the last ID).
+    ``before_id`` pages back through older messages. ``order`` is ``asc``
+    (oldest first) or ``desc`` (newest first).
+    """
     if limit <= 0 or limit > 500:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Limit must be between 1 and 500")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order must be 'asc' or 'desc'")
+    if since_id is not None and before_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Use either since_id or before_id, not both"
+        )
 
-    game = db.query(LiveGame).filter(LiveGame.id == game_id).first()
+    game = admission_cache.live_game(db, game_id)
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Live game not found")
 
-    messages = (
-        db.query(LiveGameMessage)
+    newest_first = order == "desc"
+    if game.closed_at is not None:
+        archived = chat_archive.live_game(game_id)
+        if archived is not None:
+            return json_response(_page_archived_messages(archived, since_id, before_id, limit, newest_first))
+
+    buffer_key = live_game_buffer_key(game_id)
+    if before_id is None:
+        # The tail and recent catch-ups are served from the recent-message buffer.
+        def loader(count: int) -> List[dict]:
+            return _latest_live_game_messages(db, game_id, count)
+
+        if since_id is None:
+            cached = recent_messages.tail(buffer_key, limit, loader, newest_first)
+        else:
+            cached = recent_messages.since(buffer_key, since_id, limit, loader, newest_first)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
+
+    query = live_game_history_query(db).filter(LiveGameMessage.game_id == game_id)
+    if since_id is not None:
+        query = query.filter(LiveGameMessage.id > since_id).order_by(LiveGameMessage.id.asc())
+    else:
+        if before_id is not None:
+            query = query.filter(LiveGameMessage.id < before_id)
+        query = query.order_by(LiveGameMessage.id.desc())
+    rows = query.limit(limit).all()
+
+    # since_id scans forward; everything else scans back from the tail.
+    if (since_id is not None) == newest_first:
+        rows.reverse()
+
+    return json_response(live_game_rows_to_dicts(game_id, rows))
+
+
+def _page_archived_messages(
+    messages: List[dict],
+    since_id: Optional[int],
+    before_id: Optional[int],
+    limit: int,
+    newest_first: bool,
+) -> List[dict]:
+    """Apply the endpoint's cursor semantics to an archived game, already in ID order."""
+    if since_id is not None:
+        page = [message for message in messages if message["message_id"] > since_id][:limit]
+    else:
+        if before_id is not None:
+            messages = [message for message in messages if message["message_id"] < before_id]
+        page = messages[-limit:]
+    return page[::-1] if newest_first else page
+
+
+def archive_live_games(db: Session, now: datetime) -> int:
+    """Archive task: move the chat of games closed past the retention window to cold storage."""
+    cutoff = now - timedelta(days=settings.ARCHIVE_LIVE_GAME_RETENTION_DAYS)
+    game_ids = [
+        game_id
+        for (game_id,) in db.query(LiveGameMessage.game_id)
+        .join(LiveGame, LiveGame.id == LiveGameMessage.game_id)
+        .filter(LiveGame.closed_at < cutoff)
+        .distinct()
+        .all()
+    ]
+
+    archived = 0
+    for game_id in game_ids:
+        rows = (
+            live_game_history_query(db)
+            .filter(LiveGameMessage.game_id == game_id)
+            .order_by(LiveGameMessage.id.asc())
+            .all()
+        )
+        messages = live_game_rows_to_dicts(game_id, rows)
+        chat_archive.write(
+            chat_archive.live_game_path(game_id),
+            messages,
+            sort_key=lambda message: message["message_id"],
+        )
+        db.query(LiveGameMessage).filter(LiveGameMessage.game_id == game_id).delete(synchronize_session=False)
+        db.commit()
+        recent_messages.discard(live_game_buffer_key(game_id))
+        archived += len(messages)
+    return archived
+
+
+def live_game_buffer_key(game_id: int) -> tuple:
+    return ("livegame", game_id)
+
+
+def _latest_live_game_messages(db: Session, game_id: int, count: int) -> List[dict]:
+    """Buffer loader: the game's latest ``count`` messages, oldest first."""
+    if db.query(LiveGame.id).filter(LiveGame.id == game_id).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Live game not found")
+    rows = (
+        live_game_history_query(db)
         .filter(LiveGameMessage.game_id == game_id)
-        .order_by(LiveGameMessage.created_at.asc())
-        .limit(limit)
+        .order_by(LiveGameMessage.id.desc())
+        .limit(count)
         .all()
     )
+    rows.reverse()
+    return live_game_rows_to_dicts(game_id, rows)
+
+
+def _missed_live_game_messages(db: Session, game_id: int, last_message_id: int) -> Tuple[List[dict], bool]:
+    """
+    Messages after ``last_message_id``, oldest first, for a reconnecting socket.
+    Returns at most ``RECONNECT_REPLAY_LIMIT`` and whether that was all.
+    """
+    limit = settings.RECONNECT_REPLAY_LIMIT
+    cached = recent_messages.since(
+        live_game_buffer_key(game_id),
+        last_message_id,
+        limit + 1,
+        loader=lambda count: _latest_live_game_messages(db, game_id, count),
+    )
+    if cached is not None:
+        messages = json.loads(cached)
+    else:
+        rows = (
+            live_game_history_query(db)
+            .filter(LiveGameMessage.game_id == game_id, LiveGameMessage.id > last_message_id)
+            .order_by(LiveGameMessage.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        messages = live_game_rows_to_dicts(game_id, rows)
+    return messages[:limit], len(messages) <= limit
 
+
+def live_game_history_query(db: Session):
+    """Message columns joined to the author's username, without ORM hydration."""
+    return db.query(
+        LiveGameMessage.id,
+        LiveGameMessage.user_id,
+        User.username,
+        LiveGameMessage.content,
+        LiveGameMessage.created_at,
+    ).outerjoin(User, User.user_id == LiveGameMessage.user_id)
+
+
+def live_game_rows_to_dicts(game_id: int, rows) -> List[dict]:
+    """Shape rows from live_game_history_query like LiveGameMessageResponse."""
+    user_ids = UuidStrCache()
     return [
-        LiveGameMessageResponse(
-            message_id=message.id,
-            game_id=message.game_id,
-            user_id=uuid_bytes_to_str(message.user_id) or "",
-            username=message.user.username if message.user else "Unknown",
-            content=message.content,
-            created_at=message.created_at,
-        )
-        for message in messages
+        {
+            "message_id": message_id,
+            "game_id": game_id,
+            "user_id": user_ids[user_id],
+            "username": username or "Unknown",
+            "content": content,
+            "created_at": created_at.isoformat(),
+        }
+        for message_id, user_id, username, content, created_at in rows
     ]
 
 
 @router.websocket("/ws/{game_id}")
 async def live_game_websocket(websocket: WebSocket, game_id: int) -> None:
+    started = time.perf_counter()
     logger.info("WebSocket connection attempt for game_id=%s from client %s", game_id, websocket.client)
     token = websocket.query_params.get("token")
     if not token:
         await websocket.close(code=1008, reason="Authentication required")
         return
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-    )
-
-    try:
-        token_data = verify_token(token, credentials_exception)
-    except HTTPException:
+    username = admission_cache.username_for_token(token)
+    if username is None:
         await websocket.close(code=1008, reason="Authentication failed")
         return
 
     db = SessionLocal()
+    connected = False
     try:
-        user = get_user_by_username(db, token_data.username)
-        game = db.query(LiveGame).filter(LiveGame.id == game_id).first()
+        user = admission_cache.identity_for(db, username)
+        game = admission_cache.live_game(db, game_id)
 
         if game is None or user is None:
             await websocket.close(code=1008, reason="Live game unavailable")
             return
 
+        if game.closed_at is not None:
+            await websocket.close(code=1008, reason="This match has finished")
+            return
+
         await manager.connect(game_id, websocket, user)
-        await websocket.send_json(
+        connected = True
+        await manager.send_personal(
+            game_id,
+            websocket,
             {
                 "type": "welcome",
                 "game_id": game_id,
@@ -162,49 +526,76 @@ async def live_game_websocket(websocket: WebSocket, game_id: int) -> None:
                 "away_team": game.away_team,
                 "match_date": game.match_date.isoformat() if game.match_date else None,
                 "active_users": manager.get_active_count(game_id),
+                "shard": manager.get_shard(websocket),
             }
         )
-        await manager.broadcast_presence(game_id)
+        manager.schedule_presence(game_id)
+
+        last_message_id = parse_message_id(websocket.query_params.get("last_message_id"))
+        if last_message_id is not None:
+            await manager.replay_missed(game_id, websocket, last_message_id)
+
+        manager.admission_latency.record(time.perf_counter() - started)
+        # Admission is done; don't pin a session and its identity map to the socket.
+        db.close()
 
         while True:
-            payload = await websocket.receive_json()
-            content = (payload or {}).get("content", "").strip()
+            payload = await receive_payload(
+                websocket, lambda frame: manager.send_personal(game_id, websocket, frame)
+            )
+            received = time.perf_counter()
+            manager.touch(game_id, websocket)
+            if payload.get("type") == "pong":
+                continue
+
+            rate_limited = chat_rate_limiter.check(user.user_id, ("livegame", game_id))
+            if rate_limited:
+                await manager.send_personal(game_id, websocket, rate_limited)
+                continue
+
+            content = payload.get("content")
+            content = content.strip() if isinstance(content, str) else ""
 
             if not content:
-                await websocket.send_json({"type": "error", "message": "Message cannot be empty."})
+                await manager.send_personal(game_id, websocket, {"type": "error", "message": "Message cannot be empty."})
                 continue
 
             is_clean, error_msg = check_message_content(content)
             if not is_clean:
-                await websocket.send_json({"type": "error", "message": error_msg})
+                await manager.send_personal(game_id, websocket, {"type": "error", "message": error_msg})
                 continue
 
             now = datetime.utcnow()
-            message = LiveGameMessage(
-                game_id=game_id,
-                user_id=user.user_id,
-                content=content,
-                created_at=now,
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
+            with SessionLocal() as db:
+                message_id = await save_message(
+                    db,
+                    LiveGameMessage,
+                    game_id=game_id,
+                    user_id=user.user_id,
+                    content=content,
+                    created_at=now,
+                )
 
             await manager.broadcast(
                 game_id,
                 {
                     "type": "chat_message",
-                    "message_id": message.id,
-                    "game_id": message.game_id,
-                    "user_id": uuid_bytes_to_str(message.user_id) or "",
+                    "message_id": message_id,
+                    "game_id": game_id,
+                    "user_id": uuid_bytes_to_str(user.user_id) or "",
                     "username": user.username,
-                    "content": message.content,
-                    "created_at": message.created_at.isoformat(),
+                    "content": content,
+                    "created_at": now.isoformat(),
                 },
+                origin=websocket,
             )
+            manager.message_latency.record(time.perf_counter() - received)
 
     except WebSocketDisconnect:
-        manager.disconnect(game_id, websocket)
-        await manager.broadcast_presence(game_id)
+        pass
     finally:
+        # Whatever ended the loop, don't leave the socket registered.
+        if connected:
+            manager.disconnect(game_id, websocket)
+            manager.schedule_presence(game_id)
         db.close()
@@ -3,11 +3,13 @@ from datetime import datetime, date
 from zoneinfo import ZoneInfo
 from typing import Any, Optional
 
+import anyio
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from database import get_db
+from llm_scheduler import BACKGROUND, LLMOverloaded, estimate_tokens, llm_scheduler
 from models import Trivia
 from pydantic import BaseModel, Field
 
@@ -47,7 +49,8 @@ You will be given (player_name, season_label, goals). Create ONE multiple-choice
 - Return ONLY the structured fields (no extra commentary)."""
 
 # OpenAI model (set OPENAI_API_KEY in your env)
-_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, max_tokens=300)
+MAX_TOKENS = 300
+_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, max_tokens=MAX_TOKENS)
 _structured_llm = _llm.with_structured_output(TriviaFormat)
 
 # ---------- Helpers ----------
@@ -148,13 +151,22 @@ def _generate_trivia(db: Session) -> TriviaOut:
         "Create the trivia now."
     )
 
-    # Get structured object directly from OpenAI
-    structured: TriviaFormat = _structured_llm.invoke(
-        [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
+    # Get structured object directly from OpenAI, queued behind bot replies
+    # in the shared scheduler (this route runs in a worker thread).
+    try:
+        structured: TriviaFormat = anyio.from_thread.run(
+            lambda: llm_scheduler.run(
+                _structured_llm,
+                [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                priority=BACKGROUND,
+                tokens=estimate_tokens(SYSTEM_PROMPT, user_prompt, max_tokens=MAX_TOKENS),
+            )
+        )
+    except LLMOverloaded:
+        raise HTTPException(503, "Trivia generation is busy; try again shortly.")
 
     # Force exact wording and validate
     structured.question = f"How many goals did {player} score in the {season} Premier League season?"
@@ -3,8 +3,9 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import User
 from schemas import UserResponse, UserUpdate
-from auth import get_current_active_user, get_password_hash
+from auth import get_current_active_user, get_password_hash, is_reserved_username
 from utils import user_to_response
+from admission import admission_cache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -20,6 +21,8 @@ async def update_user_me(
     db: Session = Depends(get_db)
 ):
     """Update current user information."""
+    previous_username = current_user.username
+
     # Update fields if provided
     if user_update.first_name is not None:
         current_user.first_name = user_update.first_name
@@ -33,7 +36,7 @@ async def update_user_me(
             User.username == user_update.username,
             User.user_id != current_user.user_id
         ).first()
-        if existing_user:
+        if existing_user or is_reserved_username(user_update.username):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
@@ -64,6 +67,9 @@ async def update_user_me(
     
     db.commit()
     db.refresh(current_user)
+
+    # Websocket admission caches the user's name and team; drop it everywhere.
+    await admission_cache.invalidate_user(previous_username, current_user.username)
     
     return user_to_response(current_user)
 
@@ -73,7 +79,9 @@ async def delete_user_me(
     db: Session = Depends(get_db)
 ):
     """Delete current user account."""
+    username = current_user.username
     db.delete(current_user)
     db.commit()
+    await admission_cache.invalidate_user(username)
     
     return {"message": "User account deleted successfully"}
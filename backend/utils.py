@@ -1,9 +1,12 @@
 """
 Utility functions for the application.
 """
-from typing import Optional
+from typing import Any, Dict, Optional
 import uuid
 
+from fastapi import Response
+
+from broadcast import encode_frame
 from schemas import UserResponse
 from models import User
 
@@ -29,3 +32,25 @@ def uuid_bytes_to_str(value: Optional[bytes]) -> Optional[str]:
     if value is None:
         return None
     return str(uuid.UUID(bytes=value))
+
+
+class UuidStrCache(Dict[bytes, str]):
+    """Memoised uuid_bytes_to_str for pages where the same few users repeat."""
+
+    def __missing__(self, key: Optional[bytes]) -> str:
+        value = uuid_bytes_to_str(key) or ""
+        self[key] = value
+        return value
+
+
+def parse_message_id(value: Optional[str]) -> Optional[int]:
+    """Read a message ID cursor from a query string value; None if absent or malformed."""
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def json_response(content: Any) -> Response:
+    """Serialise plain rows straight to a JSON response, skipping per-row models."""
+    return Response(content=encode_frame(content), media_type="application/json")
@@ -108,7 +108,9 @@ export default function FanRoomPanel({
     socket.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
-        if (data.type === "welcome" || data.type === "presence") {
+        if (data.type === "ping") {
+          socket.send(JSON.stringify({ type: "pong" }));
+        } else if (data.type === "welcome" || data.type === "presence") {
           const count = presenceFallback(data.active_users);
           setActiveUsers(count);
           onPresenceUpdate(room.id, count);
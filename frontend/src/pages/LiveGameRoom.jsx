@@ -154,7 +154,9 @@ const stadiumName = useMemo(() => {
     socket.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
-        if (data.type === "welcome" || data.type === "presence") {
+        if (data.type === "ping") {
+          socket.send(JSON.stringify({ type: "pong" }));
+        } else if (data.type === "welcome" || data.type === "presence") {
           setActiveUsers(presenceFallback(data.active_users));
         } else if (data.type === "chat_message") {
           setMessages((prev) => {